@@ -259,12 +259,18 @@ df_1.repartition(1000).write.mode("overwrite").parquet(model_file, compression='
 #             option("delimiter", "\t").\
 #             save(model_file,  mode='overwrite')
 
-df_2 = df_1.select("word")
+# The vocabulary is written with the number of occurrences of each word in
+# the abstracts, from the most to the least frequent, so that the lookup table
+# of the entity extractor can be pruned to the top K words (see
+# DataReader.prune_vocabulary)
+from pyspark.sql.functions import explode
+word_counts_df = abstracts_full_df4.select(explode("words").alias("word")).groupBy("word").count()
+df_2 = df_1.select("word").join(word_counts_df, on="word", how="left").orderBy(col("count").desc())
 df_2.printSchema()
 vocabulary_file = "D:\\bio-ner\\tsv\\Models\\word2vec_pubmed_vocabulary_mc_{}".\
      format(min_count)
 
-df_2.repartition(1).write.\
+df_2.coalesce(1).write.\
              format("com.databricks.spark.csv").\
              option("header", "true").\
              option("delimiter", "\t").\
@@ -1,416 +1,1104 @@
-from keras.preprocessing import sequence
-import numpy as np
-import nltk
-from nltk.tokenize import sent_tokenize
-
-import _pickle as cPickle
-
-class DataReader:
-
-    def __init__ (self, input_resources_pickle_file =None):
-        # Some constants
-        self.num_classes = 0
-        self.num_embedding_features = 0
-        self.max_sentence_len_train =0
-        
-        # Other stuff
-        self.wordvecs = None
-        self.word_to_ix_map = {}                
-        self.n_sentences_all = 0
-        self.tag_to_vector_map = {}
-        self.vector_to_tag_map = {}                
-        
-
-        if not (input_resources_pickle_file is None):
-            self.load_resources_pickle_file (input_resources_pickle_file)                 
-
-    ##################################################
-    # decode_prediction_sequence
-    ##################################################
-    def decode_prediction_sequence (self, pred_seq):
-        
-        pred_tags = []
-        for class_prs in pred_seq:
-            class_vec = np.zeros(self.num_classes, dtype=np.int32)
-            class_vec[np.argmax(class_prs)] = 1
-            if tuple(class_vec.tolist()) in self.vector_to_tag_map:
-                pred_tags.append(self.vector_to_tag_map[tuple(class_vec.tolist())])
-            else:
-                print(tuple(class_vec.tolist()))
-        return pred_tags
-    
-    ##################################################
-    # load_resources_pickle_file
-    ##################################################
-    def load_resources_pickle_file (self, input_resources_pickle_file):
-        
-        print("Loading the resources pickle file {}".format(input_resources_pickle_file))
-        
-        with open(input_resources_pickle_file, 'rb') as f:           
-            pickle_content = cPickle.load(f, encoding='bytes')   
-
-        self.word_to_ix_map = pickle_content["word_to_ix_map"]
-        self.wordvecs = pickle_content["wordvecs"]
-        self.num_embedding_features = pickle_content["num_embedding_features"] 
-        self.num_classes = pickle_content["num_classes"] 
-        self.max_sentence_len_train = pickle_content["max_sentence_len_train"] 
-        self.tag_to_vector_map = pickle_content["tag_to_vector_map"]
-        self.vector_to_tag_map = pickle_content["vector_to_tag_map"]
-        self.zero_vec_pos = pickle_content["zero_vec_pos"] 
-
-    ##################################################
-    # load_embedding_lookup_table
-    ##################################################
-    def load_embedding_lookup_table (self, embeddings_file):
-        
-        ###Load the Word2Vec Model###
-        print("Loading the W2V model from file {}".format(embeddings_file))
-        #W2V_model = cPickle.load(open(embeddings_file, "rb"))
-        with open(embeddings_file, 'rb') as f:           
-            W2V_model = cPickle.load(f, encoding='bytes')                     
-            
-        vocab = list(W2V_model.keys())       
-        
-        self.word_to_ix_map = {}
-        self.wordvecs = []
-        
-        ###Create LookUp Table for words and their word vectors###
-        
-        print("Creating the lookup table")
-        for index, word in enumerate(vocab):
-            self.word_to_ix_map[word] = index            
-            self.wordvecs.append(W2V_model[vocab[index]])            
-            
-           
-        self.wordvecs = np.array(self.wordvecs)
-        print("Number of entries in the lookup table = {}".format(len(self.wordvecs)))
-        self.num_embedding_features = len(self.wordvecs[0])
-        print("embedding size = {}".format(self.num_embedding_features))
-        
-        # Add a zero vector for the Paddings
-        self.wordvecs = np.vstack((self.wordvecs, np.zeros(self.num_embedding_features)))
-        self.zero_vec_pos = self.wordvecs.shape[0] - 1
-        
-        print("Done")
-        return (self.wordvecs)    
-    
-    
-    ##################################################
-    ##  read_and_parse_training_data  
-    ##################################################
-    def read_and_parse_training_data (self, train_file, output_resources_pickle_file):
-        
-        print("Loading the training data from file {}".format(train_file))
-        with open(train_file, 'r') as f_train:            
-            
-            self.tag_to_vector_map = {}    # For storing one hot vector notation for each Tag
-            self.vector_to_tag_map = {} 
-            self.num_classes = 0            # Used to put 1 in the one hot vector notation
-            raw_data_train = []
-            raw_words_train = []
-            raw_tags_train = []        
-
-            # Process all lines in the file
-            for line in f_train:
-                line = line.strip()
-                if not line:
-                    raw_data_train.append( (tuple(raw_words_train), tuple(raw_tags_train)))
-                    raw_words_train = []
-                    raw_tags_train = []
-                    continue
-                
-                word, tag = line.split('\t')
-                
-                raw_words_train.append(word)
-                raw_tags_train.append(tag)
-                
-                if tag not in self.tag_to_vector_map:                    
-                    self.tag_to_vector_map[tag] = None                    
-                    self.num_classes += 1
-                    
-        print("number of training examples = " + str(len(raw_data_train)))               
-        
-        all_tags = sorted(list(self.tag_to_vector_map.keys()))
-
-        for tag_class_id, tag in enumerate(all_tags):
-            one_hot_vec = np.zeros(self.num_classes +1, dtype=np.int32)
-            one_hot_vec[tag_class_id] = 1
-            self.tag_to_vector_map[tag] = tuple(one_hot_vec)
-            self.vector_to_tag_map[tuple(one_hot_vec)] = tag
-
-         #Adding a None Tag        
-        one_hot_vec = np.zeros(self.num_classes +1, dtype=np.int32)
-        one_hot_vec[self.num_classes] = 1
-        self.tag_to_vector_map['NONE'] = tuple(one_hot_vec)
-        self.vector_to_tag_map[tuple(one_hot_vec)] = 'NONE'
-        self.num_classes += 1
-
-        self.n_sentences_all = len(raw_data_train)
-
-        # Find the maximum sequence length for Training data
-        self.max_sentence_len_train = 0
-        for seq in raw_data_train:
-            if len(seq[0]) > self.max_sentence_len_train:
-                self.max_sentence_len_train = len(seq[0])                
-        
-         ############## Create Train Vectors################
-        all_X_train, all_Y_train = [], []        
-        unk_words = []
-        count = 0
-        for word_seq, tag_seq in raw_data_train:  
-            
-            elem_wordvecs, elem_tags = [], []            
-            for ix in range(len(word_seq)):
-                w = word_seq[ix]
-                t = tag_seq[ix]
-                w = w.lower()
-                if w in self.word_to_ix_map :
-                    count += 1
-                    elem_wordvecs.append(self.word_to_ix_map[w])
-                    elem_tags.append(self.tag_to_vector_map[t])
-
-                elif "UNK" in self.word_to_ix_map :
-                    unk_words.append(w)
-                    elem_wordvecs.append(self.word_to_ix_map["UNK"])
-                    elem_tags.append(self.tag_to_vector_map[t])
-                
-                else:
-                    unk_words.append(w)
-                    w = "UNK"       
-                    new_wv = 2 * np.random.randn(self.num_embedding_features) - 1 # sample from normal distribution
-                    norm_const = np.linalg.norm(new_wv)
-                    new_wv /= norm_const
-                    self.wordvecs = np.vstack((self.wordvecs, new_wv))
-                    self.word_to_ix_map[w] = self.wordvecs.shape[0] - 1
-                    elem_wordvecs.append(self.word_to_ix_map[w])
-                    elem_tags.append(list(self.tag_to_vector_map[t]))
-
-            
-            # Pad the sequences for missing entries to make them all the same length
-            nil_X = self.zero_vec_pos
-            nil_Y = np.array(self.tag_to_vector_map['NONE'])
-            pad_length = self.max_sentence_len_train - len(elem_wordvecs)
-            all_X_train.append( ((pad_length)*[nil_X]) + elem_wordvecs)
-            all_Y_train.append( ((pad_length)*[nil_Y]) + elem_tags)
-
-        all_X_train = np.array(all_X_train)
-        all_Y_train = np.array(all_Y_train)
-        
-        print("UNK WORD COUNT = " + str(len(unk_words)))
-        print("Found WORDS COUNT = " + str(count))
-        print("TOTAL WORDS COUNT= " + str(count+len(unk_words)))    
-
-        self.save_resources(output_resources_pickle_file)
-       
-        print("Done")
-        
-        return (all_X_train, all_Y_train)
-
-    ##################################################
-    # save_resources
-    ##################################################
-    def save_resources(self, output_resources_pickle_file):
-        print("saving the resources into the file {}".format(output_resources_pickle_file))
-        pickle_content = {}       
-        pickle_content["word_to_ix_map"] = self.word_to_ix_map
-        pickle_content["wordvecs"] = self.wordvecs
-        pickle_content["num_embedding_features"] = self.num_embedding_features
-        pickle_content["num_classes"] = self.num_classes
-        pickle_content["max_sentence_len_train"] = self.max_sentence_len_train
-        pickle_content["tag_to_vector_map"] = self.tag_to_vector_map
-        pickle_content["vector_to_tag_map"] = self.vector_to_tag_map
-        pickle_content["zero_vec_pos"] = self.zero_vec_pos
-        
-        cPickle.dump(pickle_content, open(output_resources_pickle_file, "wb"))
-        print("Done")
-
-    ################################################## 
-    #  read_and_parse_test_data 
-    ################################################## 
-    def read_and_parse_test_data (self, test_file):       
-        
-        print("Loading test data from file {}".format(test_file))
-        with open(test_file, 'r') as f_test:                        
-            
-            data_set = []            
-            sentence_words = []
-            sentence_tags = []        
-
-            # Process all lines in the file
-            for line in f_test:
-                line = line.strip()
-                if not line:
-                    data_set.append( (tuple(sentence_words), tuple(sentence_tags)))
-                    sentence_words = []
-                    sentence_tags = []
-                    continue
-                
-                word, tag = line.split('\t')                 
-                
-                sentence_words.append(word)
-                sentence_tags.append(tag)                
-                                    
-        print("number of test examples = " + str(len(data_set)))   
-        self.n_sentences_all = len(data_set)
-    
-        #Create TEST feature vectors
-        all_X_test, all_Y_test = [], []
-        num_tokens_list = []
-        unk_words = []
-        count = 0
-
-        for word_seq, tag_seq in data_set:              
-            if len(word_seq) > self.max_sentence_len_train:
-               print("skip the extra words in the long sentence")
-               word_seq = word_seq[:self.max_sentence_len_train]
-               tag_seq = tag_seq[:self.max_sentence_len_train]
-
-            elem_wordvecs, elem_tags = [], []            
-            for ix in range(len(word_seq)):
-                w = word_seq[ix]
-                w = w.lower()
-
-                t = tag_seq[ix]
-
-                #ignore the word if it has uncovered ground truth entity type
-                if not (t in self.tag_to_vector_map):
-                    continue
-                
-                if w in self.word_to_ix_map:
-                    count += 1
-                    elem_wordvecs.append(self.word_to_ix_map[w])
-                    elem_tags.append(self.tag_to_vector_map[t])
-                    
-                elif "UNK" in self.word_to_ix_map :
-                    unk_words.append(w)
-                    elem_wordvecs.append(self.word_to_ix_map["UNK"])
-                    elem_tags.append(self.tag_to_vector_map[t])
-                    
-                else:
-                    unk_words.append(w)
-                    w = "UNK"
-                    self.word_to_ix_map[w] = self.wordvecs.shape[0] - 1
-                    elem_wordvecs.append(self.word_to_ix_map[w])
-                    elem_tags.append(self.tag_to_vector_map[t])
-                
-            # Pad the sequences for missing entries to make all the sentences the same length
-            nil_X = self.zero_vec_pos
-            nil_Y = np.array(self.tag_to_vector_map['NONE'])
-            num_tokens_list.append(len(elem_wordvecs))
-            pad_length = self.max_sentence_len_train - len(elem_wordvecs)
-            all_X_test.append( ((pad_length)*[nil_X]) + elem_wordvecs)
-            all_Y_test.append( ((pad_length)*[nil_Y]) + elem_tags)
-
-        all_X_test = np.array(all_X_test)
-        all_Y_test = np.array(all_Y_test)
-        
-        print("UNK WORD COUNT = " + str(len(unk_words)))
-        print("Found WORDS COUNT = " + str(count))
-        print("TOTAL WORDS COUNT = " + str(count+len(unk_words)))         
-        
-        print("Done")
-        
-        return (all_X_test, all_Y_test, data_set, num_tokens_list)                                         
-        
-        
-     ##################################################
-     #  get_feature_vectors_2  
-     ################################################## 
-    def get_feature_vectors_2 (self, data_file):        
-
-        print("Loading unlabeled data from file {}".format(data_file))
-        with open(data_file, 'r') as f_data:                                    
-            all_sentences_words = []
-                 
-
-            # Process all lines in the file
-            for line in f_data:
-                text = line.strip()                                
-
-                #break the input text into sentences before tokenization
-                sentences = sent_tokenize(text)
-                
-                for sent in sentences:
-                    sentence_words = nltk.word_tokenize(sent)                             
-                    all_sentences_words.append( tuple(sentence_words) )                                                           
-        
-        self.n_sentences_all = len(all_sentences_words)   
-        print("number of unlabeled examples = {}".format(self.n_sentences_all))
-        return self.create_feature_vectors(all_sentences_words)
-
-    ##################################################
-    #  get_feature_vectors_1  
-    ################################################## 
-    def get_feature_vectors_1 (self, data_list):        
-
-        print("Reading unlabeled data from dataframe")   
-        # list of list of tokens
-        all_sentences_words = []           
-
-        # Process all lines in the file
-        for line in data_list:
-            text = line.strip()                                
-
-            #break the input text into sentences before tokenization
-            sentences = sent_tokenize(text)
-            
-            for sent in sentences:
-                sentence_words = nltk.word_tokenize(sent)                             
-                all_sentences_words.append( tuple(sentence_words) )                                                                                             
-        
-        self.n_sentences_all = len(all_sentences_words)        
-        print("number of unlabeled examples = {}".format(self.n_sentences_all))
-        return self.create_feature_vectors(all_sentences_words)
-
-    ################################################## 
-    #   create_feature_vectors
-    ################################################## 
-    def create_feature_vectors(self, all_sentences_words):
-        all_X_data = []
-        word_seq_list = []
-        num_tokens_list = []
-        unk_words = []
-        count = 0
-
-        for word_seq in all_sentences_words:  
-            if len(word_seq) > self.max_sentence_len_train:
-                print("skip the extra words in the long sentence")
-                word_seq = word_seq[:self.max_sentence_len_train]
-
-            word_seq_list.append(word_seq)
-
-            elem_wordvecs = []            
-            for ix in range(len(word_seq)):
-                w = word_seq[ix]
-                
-                w = w.lower()
-                if w in self.word_to_ix_map:
-                    count += 1
-                    elem_wordvecs.append(self.word_to_ix_map[w])                
-                    
-                elif "UNK" in self.word_to_ix_map :
-                    unk_words.append(w)
-                    elem_wordvecs.append(self.word_to_ix_map["UNK"])                    
-                    
-                else:
-                    unk_words.append(w)
-                    w = "UNK"
-                    self.word_to_ix_map[w] = self.wordvecs.shape[0] - 1
-                    elem_wordvecs.append(self.word_to_ix_map[w])                    
-                
-            # Pad the sequences for missing entries to make them all the same length
-            nil_X = self.zero_vec_pos
-            num_tokens_list.append(len(elem_wordvecs))
-            pad_length = self.max_sentence_len_train - len(elem_wordvecs)
-            all_X_data.append( ((pad_length)*[nil_X]) + elem_wordvecs)            
-
-        all_X_data = np.array(all_X_data)        
-        
-        print("UNK WORD COUNT = " + str(len(unk_words)))
-        print("Found WORDS COUNT = " + str(count))
-        print("TOTAL WORDS = " + str(count+len(unk_words)))         
-        
-        print("Done")
-        
-        return (all_X_data, word_seq_list, num_tokens_list)
- 
\ No newline at end of file
+import numpy as np
+import os
+import zlib
+import hashlib
+import shutil
+import multiprocessing
+import functools
+import itertools
+import nltk
+from nltk.tokenize import sent_tokenize
+
+import _pickle as cPickle
+from Vocabulary import Vocabulary
+from FastTokenizer import FastTokenizer
+
+fast_tokenizer = FastTokenizer()
+
+##################################################
+# tokenize_text
+# break a text into sentences and each sentence into words with
+# nltk.word_tokenize ('nltk') or the regex FastTokenizer ('fast').
+# Defined at the module level so it can be sent to the tokenizer processes
+##################################################
+def tokenize_text (text, tokenizer = 'nltk'):
+    #break the input text into sentences before tokenization
+    sentences = sent_tokenize(text.strip())
+    if tokenizer == 'fast':
+        return [tuple(fast_tokenizer.tokenize(sent)) for sent in sentences]
+    return [tuple(nltk.word_tokenize(sent)) for sent in sentences]
+
+class DataReader:
+
+    def __init__ (self, input_resources_pickle_file =None, mmap_resources = False, \
+                  num_tokenizer_workers = 1, tokenizer_chunk_size = 100, tokenizer = 'nltk', \
+                  max_sentence_len = None, sliding_window = False, window_overlap = 32, dataset_cache_dir = None):
+        # Some constants
+        self.num_classes = 0
+        self.num_embedding_features = 0
+        self.max_sentence_len_train =0
+        
+        # Other stuff
+        self.wordvecs = None
+        self.word_to_ix_map = {}                
+        self.n_sentences_all = 0
+        self.zero_vec_pos = 0
+        self.num_oov_buckets = 0        # extra lookup table rows shared by the unknown words
+        self.oov_bucket_start = 0
+        self.tag_to_id_map = {}         # tag -> class id
+        self.id_to_tag = np.array([])   # class id -> tag
+
+        # save the lookup table and the vocabulary next to the resources pickle file as .npy files
+        self.mmap_resources = mmap_resources
+
+        # number of processes that tokenize the unlabeled texts (None: one per CPU core).
+        # The texts are sent to the processes in chunks of tokenizer_chunk_size
+        self.num_tokenizer_workers = num_tokenizer_workers
+        self.tokenizer_chunk_size = tokenizer_chunk_size
+
+        # 'nltk' for nltk.word_tokenize, 'fast' for the regex FastTokenizer that gives the same splits
+        if tokenizer not in ('nltk', 'fast'):
+            raise ValueError("unknown tokenizer {}, use 'nltk' or 'fast'".format(tokenizer))
+        self.tokenizer = tokenizer
+
+        # the training sentences longer than max_sentence_len are split into overlapping windows
+        # and the padded length is at most max_sentence_len (None: the longest training sentence)
+        self.max_sentence_len = max_sentence_len
+        # tag the sentences longer than max_sentence_len_train in overlapping windows
+        # of that length instead of truncating them
+        self.sliding_window = sliding_window
+        self.window_overlap = window_overlap
+
+        # sorted copy of word_to_ix_map used for the vectorized word lookups
+        self.sorted_vocabulary = None
+        self.sorted_vocabulary_source = None
+
+        # folder of the vectorized training and test data sets (None: no cache), see get_dataset_cache_path
+        self.dataset_cache_dir = dataset_cache_dir
+        self.vocabulary_digest = None
+        self.vocabulary_digest_source = None
+        
+
+        if not (input_resources_pickle_file is None):
+            self.load_resources_pickle_file (input_resources_pickle_file)                 
+
+    ##################################################
+    # decode_prediction_sequence
+    ##################################################
+    def decode_prediction_sequence (self, pred_seq):
+        
+        return list(self.id_to_tag[np.argmax(pred_seq, axis=-1)])
+
+    ##################################################
+    # decode_prediction_batch
+    # decode a whole (batch, seq, classes) probability tensor with a single
+    # argmax and return the tags of each sentence without the left padding
+    ##################################################
+    def decode_prediction_batch (self, prob_batch, num_tokens_list):
+        return self.decode_class_id_batch(np.argmax(prob_batch, axis=-1), num_tokens_list)
+
+    ##################################################
+    # decode_class_ids
+    ##################################################
+    def decode_class_ids (self, class_ids):
+        return list(self.id_to_tag[np.asarray(class_ids, dtype=np.intp)])
+
+    ##################################################
+    # decode_class_id_batch
+    # map a (batch, seq) class id matrix to tags and remove the left padding
+    ##################################################
+    def decode_class_id_batch (self, class_id_batch, num_tokens_list):
+        tag_batch = self.id_to_tag[np.asarray(class_id_batch, dtype=np.intp)]
+        seq_len = tag_batch.shape[1]
+        return [sent_tags[seq_len - num_tokens:].tolist() for sent_tags, num_tokens in zip(tag_batch, num_tokens_list)]
+
+    ##################################################
+    # set_tags
+    # assign the class ids in the order of the given tags
+    ##################################################
+    def set_tags (self, all_tags):
+        self.id_to_tag = np.array(all_tags)
+        self.tag_to_id_map = {tag: tag_class_id for tag_class_id, tag in enumerate(all_tags)}
+        self.num_classes = len(all_tags)
+    
+    ##################################################
+    # get_num_tokens
+    # number of real tokens in each row of a left padded feature matrix
+    ##################################################
+    def get_num_tokens (self, all_X):
+        all_X = np.asarray(all_X)
+        num_paddings = np.cumprod(all_X == self.zero_vec_pos, axis=1).sum(axis=1)
+        return list(all_X.shape[1] - num_paddings)
+
+    ##################################################
+    # create_length_buckets
+    # group the sentences by length into buckets of bucket_width tokens and
+    # split each bucket into batches of at most batch_size sentences.
+    # Returns a list of (sentence indices, padded length) pairs where the padded
+    # length is the length of the longest sentence in the batch
+    ##################################################
+    def create_length_buckets (self, num_tokens_list, batch_size, bucket_width = 8):
+        num_tokens_arr = np.asarray(num_tokens_list)
+        bucket_ids = (num_tokens_arr + bucket_width - 1) // bucket_width
+
+        batches = []
+        for bucket_id in np.unique(bucket_ids):
+            bucket_indices = np.flatnonzero(bucket_ids == bucket_id)
+            for ind in range(0, len(bucket_indices), batch_size):
+                sent_indices = bucket_indices[ind:ind + batch_size]
+                seq_len = max(1, int(num_tokens_arr[sent_indices].max()))
+                batches.append((sent_indices, seq_len))
+        return batches
+
+    ##################################################
+    # generate_bucketed_batches
+    # endless generator of (X, Y) batches for fit_generator, each batch
+    # trimmed to the padded length of its bucket. With sample_weights,
+    # (X, Y, sample weights) batches are generated
+    ##################################################
+    def generate_bucketed_batches (self, all_X, all_Y, batches, shuffle = True, sample_weights = False):
+        while True:
+            order = np.random.permutation(len(batches)) if shuffle else range(len(batches))
+            for batch_ind in order:
+                sent_indices, seq_len = batches[batch_ind]
+                batch_X = all_X[sent_indices, -seq_len:]
+                if sample_weights:
+                    yield (batch_X, all_Y[sent_indices, -seq_len:], self.get_sample_weights(batch_X))
+                else:
+                    yield (batch_X, all_Y[sent_indices, -seq_len:])
+
+    ##################################################
+    # get_sample_weights
+    # temporal sample weights of a feature matrix: 1 for the
+    # real tokens, 0 for the paddings so they don't count in the loss
+    ##################################################
+    def get_sample_weights (self, all_X):
+        return (np.asarray(all_X) != self.zero_vec_pos).astype(np.float32)
+
+    ##################################################
+    # load_resources_pickle_file
+    ##################################################
+    def load_resources_pickle_file (self, input_resources_pickle_file):
+        
+        print("Loading the resources pickle file {}".format(input_resources_pickle_file))
+        
+        with open(input_resources_pickle_file, 'rb') as f:           
+            pickle_content = cPickle.load(f, encoding='bytes')   
+
+        if "wordvecs_file" in pickle_content:
+            # the lookup table and the vocabulary are memory-mapped from the .npy files
+            resources_dir = os.path.dirname(input_resources_pickle_file)
+            self.wordvecs = np.load(os.path.join(resources_dir, pickle_content["wordvecs_file"]), mmap_mode='r')
+            self.word_to_ix_map = Vocabulary.load(os.path.join(resources_dir, pickle_content["vocab_words_file"]), \
+                                                  os.path.join(resources_dir, pickle_content["vocab_indices_file"]))
+        else:
+            self.word_to_ix_map = pickle_content["word_to_ix_map"]
+            self.wordvecs = pickle_content["wordvecs"]
+        self.num_embedding_features = pickle_content["num_embedding_features"] 
+        self.num_classes = pickle_content["num_classes"] 
+        self.max_sentence_len_train = pickle_content["max_sentence_len_train"] 
+        if "id_to_tag" in pickle_content:
+            self.set_tags(pickle_content["id_to_tag"])
+        else:
+            # resources saved by older versions store one hot vectors for each tag
+            all_tags = [None] * self.num_classes
+            for one_hot_vec, tag in pickle_content["vector_to_tag_map"].items():
+                all_tags[int(np.argmax(one_hot_vec))] = tag
+            self.set_tags(all_tags)
+        self.zero_vec_pos = pickle_content["zero_vec_pos"] 
+        self.num_oov_buckets = pickle_content.get("num_oov_buckets", 0)
+        self.oov_bucket_start = pickle_content.get("oov_bucket_start", 0)
+
+    ##################################################
+    # create_random_word_vectors
+    # random unit vectors for the rows that are not in the embeddings
+    ##################################################
+    def create_random_word_vectors (self, num_vectors):
+        new_wvs = 2 * np.random.randn(num_vectors, self.num_embedding_features) - 1 # sample from normal distribution
+        new_wvs /= np.linalg.norm(new_wvs, axis=1, keepdims=True)
+        return new_wvs
+
+    ##################################################
+    # load_embedding_lookup_table
+    # The lookup table is allocated once with all its rows:
+    #   row 0                 zero vector for the paddings
+    #   rows 1 .. V           the words of the embeddings
+    #   row V + 1             random vector for "UNK" (if the embeddings don't have one)
+    #   next num_oov_buckets  random vectors, unknown words are hashed into them
+    ##################################################
+    def load_embedding_lookup_table (self, embeddings_file, num_oov_buckets = 0):
+        
+        ###Load the Word2Vec Model###
+        print("Loading the W2V model from file {}".format(embeddings_file))
+        #W2V_model = cPickle.load(open(embeddings_file, "rb"))
+        with open(embeddings_file, 'rb') as f:           
+            W2V_model = cPickle.load(f, encoding='bytes')                     
+            
+        vocab = list(W2V_model.keys())       
+        self.num_embedding_features = len(W2V_model[vocab[0]])
+        print("embedding size = {}".format(self.num_embedding_features))
+
+        num_unk_rows = 0 if "UNK" in W2V_model else 1
+        num_rows = 1 + len(vocab) + num_unk_rows + num_oov_buckets
+        
+        self.word_to_ix_map = {}
+        self.wordvecs = np.zeros((num_rows, self.num_embedding_features), dtype=np.float32)
+        
+        ###Create LookUp Table for words and their word vectors###
+        
+        print("Creating the lookup table")
+        # Row 0 stays a zero vector for the Paddings
+        self.zero_vec_pos = 0
+        for index, word in enumerate(vocab, 1):
+            self.word_to_ix_map[word] = index            
+            self.wordvecs[index] = W2V_model[word]
+
+        if num_unk_rows > 0:
+            self.word_to_ix_map["UNK"] = len(vocab) + 1
+            self.wordvecs[len(vocab) + 1] = self.create_random_word_vectors(1)[0]
+
+        self.num_oov_buckets = num_oov_buckets
+        self.oov_bucket_start = len(vocab) + 1 + num_unk_rows
+        if num_oov_buckets > 0:
+            self.wordvecs[self.oov_bucket_start:] = self.create_random_word_vectors(num_oov_buckets)
+
+        print("Number of entries in the lookup table = {}".format(len(self.wordvecs)))
+        print("Done")
+        return (self.wordvecs)    
+    
+    
+    ##################################################
+    # read_word_ranking
+    # the words of a word count file from the most to the least frequent.
+    # It is a tab separated file (or the folder of part files written by
+    # Spark) with a "word" column and an optional "count" column; without
+    # counts the words are taken in the order of the file
+    ##################################################
+    def read_word_ranking (self, word_counts_file):
+        if os.path.isdir(word_counts_file):
+            paths = sorted(os.path.join(word_counts_file, name) for name in os.listdir(word_counts_file) if name.startswith("part"))
+        else:
+            paths = [word_counts_file]
+
+        words, counts = [], []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                header = f.readline().rstrip('\r\n').split('\t')
+                word_col = header.index('word')
+                count_col = header.index('count') if 'count' in header else None
+                for line in f:
+                    fields = line.rstrip('\r\n').split('\t')
+                    if len(fields) <= word_col:
+                        continue
+                    words.append(fields[word_col])
+                    if count_col is not None:
+                        counts.append(int(fields[count_col]) if len(fields) > count_col and fields[count_col] else 0)
+
+        if len(counts) > 0:
+            order = np.argsort(-np.array(counts, dtype=np.int64), kind='mergesort')
+            words = [words[ind] for ind in order]
+        return words
+
+    ##################################################
+    # prune_vocabulary
+    # keep in the lookup table only the words of the training files and the
+    # top_k most frequent words of the word count file, the other words
+    # fall back to UNK (or the OOV buckets). The table keeps its layout:
+    # padding, kept words in their original order, UNK, OOV buckets.
+    # Returns the old row of each new row, to prune a trained model the
+    # same way
+    ##################################################
+    def prune_vocabulary (self, train_files, word_counts_file = None, top_k = 0):
+        keep_words = set(["UNK"])
+        for train_file in train_files:
+            for word_seq, tag_seq in self.iterate_iob_sentences(train_file):
+                keep_words.update(w.lower() for w in word_seq)
+        num_train_words = len(keep_words) - 1
+        if word_counts_file is not None and top_k > 0:
+            keep_words.update(w.lower() for w in self.read_word_ranking(word_counts_file)[:top_k])
+
+        word_to_ix_map = self.word_to_ix_map
+        if isinstance(word_to_ix_map, Vocabulary):
+            word_to_ix_map = word_to_ix_map.to_dict()
+        if "UNK" not in word_to_ix_map:
+            # resources of older models without an UNK vector
+            word_to_ix_map["UNK"] = self.wordvecs.shape[0] - 1
+
+        kept = sorted((index, word) for word, index in word_to_ix_map.items() if word in keep_words)
+        old_rows = np.array([self.zero_vec_pos] + [index for index, word in kept] + \
+                            list(range(self.oov_bucket_start, self.oov_bucket_start + self.num_oov_buckets)), dtype=np.int64)
+
+        print("Pruning the vocabulary: {} words in the training data, {} words kept out of {}".format(num_train_words, \
+              len(kept), len(word_to_ix_map)))
+        self.wordvecs = np.asarray(self.wordvecs)[old_rows]
+        self.word_to_ix_map = {word: new_index for new_index, (old_index, word) in enumerate(kept, 1)}
+        self.zero_vec_pos = 0
+        self.oov_bucket_start = 1 + len(kept)
+        print("Number of entries in the lookup table = {}".format(len(self.wordvecs)))
+        return old_rows
+
+    ##################################################
+    # get_vocabulary_coverage
+    # share of the tokens of an IOB file that are in the vocabulary
+    ##################################################
+    def get_vocabulary_coverage (self, data_file):
+        words = [w for word_seq, tag_seq in self.iterate_iob_sentences(data_file) for w in word_seq]
+        if len(words) == 0:
+            return 1.0
+        unique_words, inverse = self.get_unique_words(words)
+        return float(np.mean(self.find_word_ids(unique_words)[inverse] >= 0))
+
+    ##################################################
+    # iterate_iob_sentences
+    # yield one (words, tags) pair per sentence of a tab separated IOB file
+    ##################################################
+    def iterate_iob_sentences (self, data_file):
+        with open(data_file, 'r') as f_data:
+            sentence_words = []
+            sentence_tags = []
+
+            # Process all lines in the file
+            for line in f_data:
+                line = line.strip()
+                if not line:
+                    yield (tuple(sentence_words), tuple(sentence_tags))
+                    sentence_words = []
+                    sentence_tags = []
+                    continue
+
+                word, tag = line.split('\t')
+
+                sentence_words.append(word)
+                sentence_tags.append(tag)
+
+    ##################################################
+    # get_vocabulary
+    # the vocabulary as sorted arrays, built once from word_to_ix_map
+    ##################################################
+    def get_vocabulary (self):
+        if isinstance(self.word_to_ix_map, Vocabulary):
+            return self.word_to_ix_map
+
+        if self.sorted_vocabulary_source is not self.word_to_ix_map:
+            self.sorted_vocabulary = Vocabulary.from_dict(self.word_to_ix_map)
+            self.sorted_vocabulary_source = self.word_to_ix_map
+        return self.sorted_vocabulary
+
+    ##################################################
+    # find_word_ids
+    # lookup table ids of a list of distinct lowercased words,
+    # -1 for the words that are not in the vocabulary
+    ##################################################
+    def find_word_ids (self, unique_words):
+        if isinstance(self.word_to_ix_map, Vocabulary):
+            return self.word_to_ix_map.lookup(unique_words)
+        return np.fromiter((self.word_to_ix_map.get(w, -1) for w in unique_words), dtype=np.int32, count=len(unique_words))
+
+    ##################################################
+    # get_unique_words
+    # the distinct lowercased words of a list of words, in order of first
+    # occurrence, and the position of each word in that list
+    ##################################################
+    def get_unique_words (self, words):
+        unique_words = {}
+        inverse = np.fromiter((unique_words.setdefault(w.lower(), len(unique_words)) for w in words), \
+                              dtype=np.int64, count=len(words))
+        return (list(unique_words), inverse)
+
+    ##################################################
+    # lookup_word_ids
+    # map a flat list of words to lookup table ids. Each distinct word is
+    # looked up once, then the ids are spread back to all the tokens.
+    # Unknown words are hashed into the OOV buckets if there are any,
+    # otherwise they get the id of "UNK"
+    ##################################################
+    def lookup_word_ids (self, words):
+        if len(words) == 0:
+            return (np.zeros(0, dtype=np.int32), 0)
+
+        unique_words, inverse = self.get_unique_words(words)
+        unique_ids = self.find_word_ids(unique_words)
+
+        is_unk = unique_ids < 0
+        num_unk_words = int(np.count_nonzero(is_unk[inverse]))
+        if num_unk_words > 0 and self.num_oov_buckets > 0:
+            unique_ids[is_unk] = [self.oov_bucket_start + zlib.crc32(unique_words[ind].encode('utf-8')) % self.num_oov_buckets \
+                                  for ind in np.flatnonzero(is_unk)]
+        elif num_unk_words > 0:
+            if "UNK" not in self.word_to_ix_map:
+                # resources of older models without an UNK vector
+                self.word_to_ix_map["UNK"] = self.wordvecs.shape[0] - 1
+            unique_ids[is_unk] = self.word_to_ix_map["UNK"]
+
+        return (unique_ids[inverse], num_unk_words)
+
+    ##################################################
+    # lookup_tag_ids
+    # class ids of a flat array of tags, -1 for unknown tags
+    ##################################################
+    def lookup_tag_ids (self, tags):
+        if len(tags) == 0:
+            return np.zeros(0, dtype=np.int32)
+
+        unique_tags, inverse = np.unique(np.asarray(tags, dtype=np.str_), return_inverse=True)
+        unique_tag_ids = np.array([self.tag_to_id_map.get(tag, -1) for tag in unique_tags], dtype=np.int32)
+        return unique_tag_ids[inverse]
+
+    ##################################################
+    # get_padded_positions
+    # (rows, columns) of the tokens of each sentence in a left padded
+    # (n_sentences, seq_len) matrix, in the order of the flattened tokens
+    ##################################################
+    def get_padded_positions (self, num_tokens_arr, seq_len):
+        num_tokens_arr = np.asarray(num_tokens_arr, dtype=np.int64)
+        sentence_starts = np.cumsum(num_tokens_arr) - num_tokens_arr
+
+        rows = np.repeat(np.arange(len(num_tokens_arr)), num_tokens_arr)
+        cols = np.arange(num_tokens_arr.sum()) - np.repeat(sentence_starts, num_tokens_arr) \
+            + np.repeat(seq_len - num_tokens_arr, num_tokens_arr)
+        return (rows, cols)
+
+    ##################################################
+    # get_window_spans
+    # (start, end) token ranges of the windows of window_len tokens that
+    # cover a sentence, consecutive windows share window_overlap tokens.
+    # The last window ends on the last token so all the windows are full
+    ##################################################
+    def get_window_spans (self, num_tokens, window_len):
+        if num_tokens <= window_len:
+            return [(0, num_tokens)]
+
+        stride = max(1, window_len - self.window_overlap)
+        starts = list(range(0, num_tokens - window_len, stride)) + [num_tokens - window_len]
+        return [(start, start + window_len) for start in starts]
+
+    ##################################################
+    # iterate_training_sentences
+    # the sentences of the IOB file, split into windows
+    # when they are longer than max_sentence_len
+    ##################################################
+    def iterate_training_sentences (self, train_file):
+        for word_seq, tag_seq in self.iterate_iob_sentences(train_file):
+            if self.max_sentence_len is None or len(word_seq) <= self.max_sentence_len:
+                yield (word_seq, tag_seq)
+            else:
+                for start, end in self.get_window_spans(len(word_seq), self.max_sentence_len):
+                    yield (word_seq[start:end], tag_seq[start:end])
+
+    ##################################################
+    # has_windows
+    # True when some sentences are longer than max_sentence_len_train,
+    # their rows in the feature matrix are then the windows of cut_windows
+    ##################################################
+    def has_windows (self, num_tokens_list):
+        return len(num_tokens_list) > 0 and int(np.max(num_tokens_list)) > self.max_sentence_len_train
+
+    ##################################################
+    # get_windows
+    # (sentence index, start, end) of each row of the feature matrix:
+    # one row per sentence, or one row per window of window_len tokens
+    # (see get_window_spans) for the sentences longer than that
+    ##################################################
+    def get_windows (self, num_tokens_list, window_len):
+        return [(sent_ind, start, end) for sent_ind, num_tokens in enumerate(num_tokens_list) \
+                for start, end in self.get_window_spans(int(num_tokens), window_len)]
+
+    ##################################################
+    # get_window_num_tokens
+    # number of tokens of each row of the feature matrix of sentences
+    # that have windows (see has_windows)
+    ##################################################
+    def get_window_num_tokens (self, num_tokens_list):
+        return [end - start for sent_ind, start, end in self.get_windows(num_tokens_list, self.max_sentence_len_train)]
+
+    ##################################################
+    # cut_windows
+    # the values of the flattened tokens of the windows of the sentences
+    # and the number of tokens of each window, in the order of get_windows
+    ##################################################
+    def cut_windows (self, flat_values, num_tokens_arr, window_len):
+        num_tokens_arr = np.asarray(num_tokens_arr, dtype=np.int64)
+        sentence_starts = np.cumsum(num_tokens_arr) - num_tokens_arr
+        windows = np.array(self.get_windows(num_tokens_arr, window_len), dtype=np.int64).reshape(-1, 3)
+
+        window_starts = sentence_starts[windows[:, 0]] + windows[:, 1]
+        window_lens = windows[:, 2] - windows[:, 1]
+        token_index = np.arange(window_lens.sum()) + np.repeat(window_starts - (np.cumsum(window_lens) - window_lens), window_lens)
+        return (np.asarray(flat_values)[token_index], window_lens)
+
+    ##################################################
+    # stitch_windows
+    # the values (tags) of each sentence from the values of its windows:
+    # the overlap of two consecutive windows is split in its middle, so
+    # each token is taken from the window where it is furthest from the edges
+    ##################################################
+    def stitch_windows (self, window_values, num_tokens_list):
+        sentence_values = [[] for num_tokens in num_tokens_list]
+        windows = self.get_windows(num_tokens_list, self.max_sentence_len_train)
+        for window_ind, (sent_ind, start, end) in enumerate(windows):
+            prev_window = windows[window_ind - 1] if window_ind > 0 else None
+            next_window = windows[window_ind + 1] if window_ind + 1 < len(windows) else None
+            first = (start + prev_window[2]) // 2 if prev_window is not None and prev_window[0] == sent_ind else start
+            last = (next_window[1] + end) // 2 if next_window is not None and next_window[0] == sent_ind else end
+            sentence_values[sent_ind].extend(window_values[window_ind][first - start:last - start])
+        return sentence_values
+
+    ##################################################
+    # vectorize_flat_words
+    # write the ids of the flattened words directly into a preallocated
+    # left padded (n_rows, seq_len) int32 matrix. The sentences longer
+    # than seq_len (only kept with sliding_window) are cut into windows
+    # of seq_len tokens, one row each, so the matrix is never wider
+    ##################################################
+    def vectorize_flat_words (self, flat_words, num_tokens_arr, seq_len):
+        word_ids, num_unk_words = self.lookup_word_ids(flat_words)
+        if len(num_tokens_arr) > 0 and np.max(num_tokens_arr) > seq_len:
+            word_ids, num_tokens_arr = self.cut_windows(word_ids, num_tokens_arr, seq_len)
+
+        all_X = np.full((len(num_tokens_arr), seq_len), self.zero_vec_pos, dtype=np.int32)
+        all_X[self.get_padded_positions(num_tokens_arr, seq_len)] = word_ids
+        return (all_X, num_unk_words)
+
+    ##################################################
+    # vectorize_training_sentences
+    # left pad the word ids and the class ids of the sentences to seq_len
+    ##################################################
+    def vectorize_training_sentences (self, sentences, seq_len):
+        num_tokens_arr = np.array([len(word_seq) for word_seq, tag_seq in sentences], dtype=np.int64)
+        flat_words = [w for word_seq, tag_seq in sentences for w in word_seq]
+        flat_tags = [t for word_seq, tag_seq in sentences for t in tag_seq]
+
+        all_X, num_unk_words = self.vectorize_flat_words(flat_words, num_tokens_arr, seq_len)
+
+        all_Y = np.full((len(sentences), seq_len), self.tag_to_id_map['NONE'], dtype=np.uint8)
+        all_Y[self.get_padded_positions(num_tokens_arr, seq_len)] = self.lookup_tag_ids(flat_tags)
+
+        count = len(flat_words) - num_unk_words
+        return (all_X, all_Y, num_unk_words, count)
+
+    ##################################################
+    ##  read_and_parse_training_data  
+    ##################################################
+    def read_and_parse_training_data (self, train_file, output_resources_pickle_file):
+
+        cache_path = None
+        if self.dataset_cache_dir is not None:
+            # the long sentences are split into windows that share window_overlap tokens
+            window_overlap = self.window_overlap if self.max_sentence_len is not None else None
+            cache_path = self.get_dataset_cache_path(train_file, "train", self.max_sentence_len, window_overlap)
+            cached = self.load_dataset_cache(cache_path, ["X", "Y"])
+            if cached is not None:
+                arrays, meta = cached
+                self.set_tags(meta["id_to_tag"])
+                self.max_sentence_len_train = meta["max_sentence_len_train"]
+                self.n_sentences_all = len(arrays["X"])
+                print("number of training examples = " + str(self.n_sentences_all))
+                if output_resources_pickle_file is not None:
+                    self.save_resources(output_resources_pickle_file)
+                return (arrays["X"], arrays["Y"])
+        
+        print("Loading the training data from file {}".format(train_file))
+        raw_data_train = list(self.iterate_training_sentences(train_file))
+        print("number of training examples = " + str(len(raw_data_train)))               
+        
+        # the tags get class ids in sorted order, followed by a None Tag for the paddings
+        found_tags = set()
+        for word_seq, tag_seq in raw_data_train:
+            found_tags.update(tag_seq)
+        self.set_tags(sorted(found_tags) + ['NONE'])
+
+        self.n_sentences_all = len(raw_data_train)
+
+        # Find the maximum sequence length for Training data
+        self.max_sentence_len_train = 0
+        for seq in raw_data_train:
+            if len(seq[0]) > self.max_sentence_len_train:
+                self.max_sentence_len_train = len(seq[0])                
+        
+         ############## Create Train Vectors################
+        all_X_train, all_Y_train, num_unk_words, count = \
+            self.vectorize_training_sentences(raw_data_train, self.max_sentence_len_train)
+        
+        print("UNK WORD COUNT = " + str(num_unk_words))
+        print("Found WORDS COUNT = " + str(count))
+        print("TOTAL WORDS COUNT= " + str(count+num_unk_words))    
+
+        if cache_path is not None:
+            num_tokens_arr = np.array([len(word_seq) for word_seq, tag_seq in raw_data_train], dtype=np.int64)
+            self.save_dataset_cache(cache_path, {"X": all_X_train, "Y": all_Y_train, "num_tokens": num_tokens_arr, \
+                                                 "sentence_offsets": np.concatenate([[0], np.cumsum(num_tokens_arr)])}, \
+                                    {"id_to_tag": self.id_to_tag.tolist(), "max_sentence_len_train": self.max_sentence_len_train})
+
+        # None when the resources were already saved, e.g. by the hyperparameter sweep
+        if output_resources_pickle_file is not None:
+            self.save_resources(output_resources_pickle_file)
+       
+        print("Done")
+        
+        return (all_X_train, all_Y_train)
+
+    ##################################################
+    ##  scan_training_data  
+    ##  first pass of the streaming training: find the tags and the maximum
+    ##  sentence length without keeping the sentences in memory
+    ##################################################
+    def scan_training_data (self, train_file, output_resources_pickle_file):
+
+        print("Scanning the training data from file {}".format(train_file))
+        found_tags = set()
+        self.n_sentences_all = 0
+        self.max_sentence_len_train = 0
+        for word_seq, tag_seq in self.iterate_training_sentences(train_file):
+            found_tags.update(tag_seq)
+            self.n_sentences_all += 1
+            if len(word_seq) > self.max_sentence_len_train:
+                self.max_sentence_len_train = len(word_seq)
+
+        print("number of training examples = " + str(self.n_sentences_all))
+        self.set_tags(sorted(found_tags) + ['NONE'])
+
+        self.save_resources(output_resources_pickle_file)
+
+        print("Done")
+
+    ##################################################
+    ##  generate_training_batches  
+    ##  endless generator of vectorized (X, Y) mini-batches read straight from
+    ##  the IOB file, for fit_generator. Only shuffle_buffer_size batches of
+    ##  sentences are held in memory and shuffled at a time. With
+    ##  pad_to_batch_max, the buffer is sorted by length and each batch is
+    ##  padded to its longest sentence. The labels have a trailing axis of
+    ##  size 1 as expected by the sparse loss. With sample_weights, the
+    ##  temporal sample weights of each batch are generated too
+    ##################################################
+    def generate_training_batches (self, train_file, batch_size, pad_to_batch_max = False, shuffle_buffer_size = 100, \
+                                   sample_weights = False):
+
+        def vectorize_buffer (buffer):
+            np.random.shuffle(buffer)
+            if pad_to_batch_max:
+                buffer.sort(key = lambda sentence: len(sentence[0]))
+
+            batches = [buffer[ind:ind + batch_size] for ind in range(0, len(buffer), batch_size)]
+            for batch_ind in np.random.permutation(len(batches)):
+                batch = batches[batch_ind]
+                if pad_to_batch_max:
+                    seq_len = max(1, max(len(word_seq) for word_seq, tag_seq in batch))
+                else:
+                    seq_len = self.max_sentence_len_train
+                batch_X, batch_Y, _, _ = self.vectorize_training_sentences(batch, seq_len)
+                if sample_weights:
+                    yield (batch_X, np.expand_dims(batch_Y, -1), self.get_sample_weights(batch_X))
+                else:
+                    yield (batch_X, np.expand_dims(batch_Y, -1))
+
+        while True:
+            buffer = []
+            for sentence in self.iterate_training_sentences(train_file):
+                buffer.append(sentence)
+                if len(buffer) == batch_size * shuffle_buffer_size:
+                    for batch in vectorize_buffer(buffer):
+                        yield batch
+                    buffer = []
+
+            if len(buffer) > 0:
+                for batch in vectorize_buffer(buffer):
+                    yield batch
+
+    ##################################################
+    # get_dataset_cache_path
+    # folder of the cached vectorized data set of a data file. Its name
+    # contains a hash of the content of the file, of the vocabulary (lookup
+    # table ids) and of the other values the vectors depend on, so a
+    # changed file or vocabulary never reads stale vectors
+    ##################################################
+    def get_dataset_cache_path (self, data_file, *key_values):
+        file_hash = hashlib.sha1()
+        with open(data_file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                file_hash.update(block)
+
+        key_hash = hashlib.sha1(file_hash.digest())
+        key_hash.update(self.get_vocabulary_digest())
+        key_hash.update(repr((self.num_oov_buckets, self.oov_bucket_start, self.zero_vec_pos) + key_values).encode('utf-8'))
+
+        data_name = os.path.splitext(os.path.basename(data_file))[0]
+        return os.path.join(self.dataset_cache_dir, "{}_{}".format(data_name, key_hash.hexdigest()[:16]))
+
+    ##################################################
+    # get_vocabulary_digest
+    # hash of the vocabulary, computed once per vocabulary
+    ##################################################
+    def get_vocabulary_digest (self):
+        vocab = self.get_vocabulary()
+        if self.vocabulary_digest_source is not vocab or self.vocabulary_digest is None:
+            vocab_hash = hashlib.sha1()
+            vocab_hash.update(np.ascontiguousarray(vocab.words).tobytes())
+            vocab_hash.update(np.ascontiguousarray(vocab.indices).tobytes())
+            vocab_hash.update(repr(sorted(vocab.extra_words.items())).encode('utf-8'))
+            self.vocabulary_digest = vocab_hash.digest()
+            self.vocabulary_digest_source = vocab
+        return self.vocabulary_digest
+
+    ##################################################
+    # load_dataset_cache
+    # the arrays of a cached data set, memory-mapped from their .npy files,
+    # and its metadata. None if the data set is not in the cache
+    ##################################################
+    def load_dataset_cache (self, cache_path, names):
+        if not os.path.exists(os.path.join(cache_path, "meta.pkl")):
+            return None
+
+        print("Loading the vectorized data set from the cache {}".format(cache_path))
+        arrays = {name: np.load(os.path.join(cache_path, name + ".npy"), mmap_mode='r') for name in names}
+        with open(os.path.join(cache_path, "meta.pkl"), 'rb') as f:
+            meta = cPickle.load(f)
+        return (arrays, meta)
+
+    ##################################################
+    # save_dataset_cache
+    # one .npy file per array and the metadata in meta.pkl. The files are
+    # written to a temporary folder that is renamed once complete, so that
+    # an interrupted run or a concurrent one never leaves a partial entry
+    ##################################################
+    def save_dataset_cache (self, cache_path, arrays, meta):
+        tmp_cache_path = "{}.tmp{}".format(cache_path, os.getpid())
+        if os.path.exists(tmp_cache_path):
+            shutil.rmtree(tmp_cache_path)
+        os.makedirs(tmp_cache_path)
+
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_cache_path, name + ".npy"), array)
+        with open(os.path.join(tmp_cache_path, "meta.pkl"), 'wb') as f:
+            cPickle.dump(meta, f)
+
+        try:
+            os.rename(tmp_cache_path, cache_path)
+            print("saved the vectorized data set into the cache {}".format(cache_path))
+        except OSError:
+            # written by another process in the meantime
+            shutil.rmtree(tmp_cache_path)
+
+    ##################################################
+    # save_resources
+    ##################################################
+    def save_resources(self, output_resources_pickle_file):
+        print("saving the resources into the file {}".format(output_resources_pickle_file))
+        pickle_content = {}       
+        if self.mmap_resources:
+            # <name>_wordvecs.npy, <name>_vocab_words.npy and <name>_vocab_indices.npy next to <name>.pkl
+            resources_dir = os.path.dirname(output_resources_pickle_file)
+            base_name = os.path.splitext(os.path.basename(output_resources_pickle_file))[0]
+            pickle_content["wordvecs_file"] = base_name + "_wordvecs.npy"
+            pickle_content["vocab_words_file"] = base_name + "_vocab_words.npy"
+            pickle_content["vocab_indices_file"] = base_name + "_vocab_indices.npy"
+
+            np.save(os.path.join(resources_dir, pickle_content["wordvecs_file"]), np.asarray(self.wordvecs, dtype=np.float32))
+            vocab = self.word_to_ix_map if isinstance(self.word_to_ix_map, Vocabulary) else Vocabulary.from_dict(self.word_to_ix_map)
+            vocab.save(os.path.join(resources_dir, pickle_content["vocab_words_file"]), \
+                       os.path.join(resources_dir, pickle_content["vocab_indices_file"]))
+        else:
+            word_to_ix_map = self.word_to_ix_map
+            if isinstance(word_to_ix_map, Vocabulary):
+                word_to_ix_map = word_to_ix_map.to_dict()
+            pickle_content["word_to_ix_map"] = word_to_ix_map
+            pickle_content["wordvecs"] = np.asarray(self.wordvecs)
+        pickle_content["num_embedding_features"] = self.num_embedding_features
+        pickle_content["num_classes"] = self.num_classes
+        pickle_content["max_sentence_len_train"] = self.max_sentence_len_train
+        pickle_content["id_to_tag"] = self.id_to_tag.tolist()
+        pickle_content["zero_vec_pos"] = self.zero_vec_pos
+        pickle_content["num_oov_buckets"] = self.num_oov_buckets
+        pickle_content["oov_bucket_start"] = self.oov_bucket_start
+        
+        cPickle.dump(pickle_content, open(output_resources_pickle_file, "wb"))
+        print("Done")
+
+    ##################################################
+    # convert_resources_pickle_file
+    # rewrite a resources pickle file in the memory-mapped format
+    ##################################################
+    def convert_resources_pickle_file(self, input_resources_pickle_file, output_resources_pickle_file):
+        self.load_resources_pickle_file(input_resources_pickle_file)
+        self.mmap_resources = True
+        self.save_resources(output_resources_pickle_file)
+
+    ################################################## 
+    #  read_and_parse_test_data 
+    ################################################## 
+    def read_and_parse_test_data (self, test_file):       
+
+        cache_path = None
+        if self.dataset_cache_dir is not None:
+            # with sliding_window, the rows of the long sentences are their windows
+            window_overlap = self.window_overlap if self.sliding_window else None
+            cache_path = self.get_dataset_cache_path(test_file, "test", self.id_to_tag.tolist(), \
+                                                     self.max_sentence_len_train, window_overlap)
+            cached = self.load_dataset_cache(cache_path, ["X", "Y", "num_tokens", "sentence_offsets", "words", "tags"])
+            if cached is not None:
+                arrays, meta = cached
+                # the sentences themselves are only needed to write the predictions
+                words, tags = arrays["words"].tolist(), arrays["tags"].tolist()
+                offsets = arrays["sentence_offsets"].tolist()
+                data_set = [(tuple(words[start:end]), tuple(tags[start:end])) for start, end in zip(offsets[:-1], offsets[1:])]
+                self.n_sentences_all = len(data_set)
+                print("number of test examples = " + str(len(data_set)))
+                return (arrays["X"], arrays["Y"], data_set, arrays["num_tokens"].tolist())
+        
+        print("Loading test data from file {}".format(test_file))
+        data_set = list(self.iterate_iob_sentences(test_file))
+        print("number of test examples = " + str(len(data_set)))   
+        self.n_sentences_all = len(data_set)
+    
+        #Create TEST feature vectors
+        seq_len = self.max_sentence_len_train
+        flat_words, flat_tags, sentence_lens = [], [], []
+        num_truncated = 0
+        for word_seq, tag_seq in data_set:              
+            if len(word_seq) > seq_len and not self.sliding_window:
+               num_truncated += 1
+               word_seq = word_seq[:seq_len]
+               tag_seq = tag_seq[:seq_len]
+
+            flat_words.extend(word_seq)
+            flat_tags.extend(tag_seq)
+            sentence_lens.append(len(word_seq))
+
+        if num_truncated > 0:
+            print("skip the extra words in {} long sentences".format(num_truncated))
+
+        #ignore the words that have uncovered ground truth entity types
+        tag_ids = self.lookup_tag_ids(flat_tags)
+        is_covered = tag_ids >= 0
+        token_rows = np.repeat(np.arange(len(data_set)), sentence_lens)
+        num_tokens_arr = np.bincount(token_rows[is_covered], minlength=len(data_set))
+        flat_words = np.asarray(flat_words, dtype=np.str_)[is_covered]
+
+        # Pad the sequences for missing entries to make all the sentences the same length
+        all_X_test, num_unk_words = self.vectorize_flat_words(flat_words, num_tokens_arr, seq_len)
+        row_tag_ids, row_num_tokens = tag_ids[is_covered], num_tokens_arr
+        if len(all_X_test) > len(data_set):
+            row_tag_ids, row_num_tokens = self.cut_windows(row_tag_ids, num_tokens_arr, seq_len)
+        all_Y_test = np.full(all_X_test.shape, self.tag_to_id_map['NONE'], dtype=np.uint8)
+        all_Y_test[self.get_padded_positions(row_num_tokens, seq_len)] = row_tag_ids
+
+        num_tokens_list = num_tokens_arr.tolist()
+        count = len(flat_words) - num_unk_words
+
+        print("UNK WORD COUNT = " + str(num_unk_words))
+        print("Found WORDS COUNT = " + str(count))
+        print("TOTAL WORDS COUNT = " + str(count+num_unk_words))         
+
+        if cache_path is not None:
+            sentence_lens = np.array([len(word_seq) for word_seq, tag_seq in data_set], dtype=np.int64)
+            self.save_dataset_cache(cache_path, {"X": all_X_test, "Y": all_Y_test, "num_tokens": num_tokens_arr, \
+                                                 "sentence_offsets": np.concatenate([[0], np.cumsum(sentence_lens)]), \
+                                                 "words": np.array([w for word_seq, tag_seq in data_set for w in word_seq], dtype=np.str_), \
+                                                 "tags": np.array([t for word_seq, tag_seq in data_set for t in tag_seq], dtype=np.str_)}, {})
+        
+        print("Done")
+        
+        return (all_X_test, all_Y_test, data_set, num_tokens_list)                                         
+        
+        
+    ##################################################
+    #  get_num_tokenizer_workers
+    ##################################################
+    def get_num_tokenizer_workers (self):
+        if self.num_tokenizer_workers is None:
+            return multiprocessing.cpu_count()
+        return self.num_tokenizer_workers
+
+    ##################################################
+    #  create_tokenizer_pool
+    #  process pool for tokenize_texts, to be reused by many calls (the
+    #  chunks of a file) so that the processes are started only once.
+    #  None when the texts are tokenized in the calling process
+    ##################################################
+    def create_tokenizer_pool (self):
+        num_workers = self.get_num_tokenizer_workers()
+        return multiprocessing.Pool(num_workers) if num_workers > 1 else None
+
+    ##################################################
+    #  tokenize_texts  
+    #  returns the list of sentences (tuples of words) of each text, in the
+    #  order of the texts. Large inputs are tokenized by a process pool,
+    #  the given one (see create_tokenizer_pool) or one started for the call
+    ##################################################
+    def tokenize_texts (self, texts, pool = None):
+        texts = list(texts)
+
+        if pool is None:
+            num_workers = self.get_num_tokenizer_workers()
+
+            # starting the processes is not worth it for small inputs
+            if num_workers <= 1 or len(texts) < num_workers * self.tokenizer_chunk_size:
+                return [tokenize_text(text, self.tokenizer) for text in texts]
+
+            print("Tokenizing {} texts with {} processes".format(len(texts), num_workers))
+            with multiprocessing.Pool(num_workers) as pool:
+                return self.tokenize_texts(texts, pool)
+
+        return pool.map(functools.partial(tokenize_text, tokenizer = self.tokenizer), texts, \
+                        chunksize = self.tokenizer_chunk_size)
+
+    ##################################################
+    #  get_token_offsets
+    #  (start, end) character offsets in the text of the tokens of each
+    #  of its sentences. The tokens are searched in order; the tokenizers
+    #  turn the double quotes into `` and '', which are matched back to
+    #  the quote characters of the text
+    ##################################################
+    def get_token_offsets (self, text, text_sentences):
+        sentence_offsets = []
+        pos = 0
+        for sentence_words in text_sentences:
+            token_offsets = []
+            for token in sentence_words:
+                if token in ('``', "''"):
+                    found = [(text.find(quote, pos), quote) for quote in ('"', '``', "''")]
+                    found = [(start, quote) for start, quote in found if start >= 0]
+                    start, token = min(found) if len(found) > 0 else (-1, token)
+                else:
+                    start = text.find(token, pos)
+
+                if start < 0:
+                    # not in the text as such, give it an empty span at the current position
+                    token_offsets.append((pos, pos))
+                    continue
+                pos = start + len(token)
+                token_offsets.append((start, pos))
+            sentence_offsets.append(token_offsets)
+        return sentence_offsets
+
+    ##################################################
+    #  get_entity_spans
+    #  merge the B- and I- tags of a sentence into entities
+    #  {"start", "end", "type", "text"} with the character offsets of the
+    #  entities in the text. The O and NONE tokens are dropped, an I- tag
+    #  that doesn't continue an entity of the same type starts a new one.
+    #  The tokens not found in the text (empty spans) are dropped like O
+    ##################################################
+    def get_entity_spans (self, text, token_offsets, tags):
+        entities = []
+        entity = None
+        for (start, end), tag in zip(token_offsets, tags):
+            prefix, _, entity_type = tag.partition('-')
+            if prefix not in ('B', 'I') or entity_type == '' or start == end:
+                entity = None
+                continue
+
+            if prefix == 'I' and entity is not None and entity["type"] == entity_type:
+                entity["end"] = end
+            else:
+                entity = {"start": start, "end": end, "type": entity_type}
+                entities.append(entity)
+
+        for entity in entities:
+            entity["text"] = text[entity["start"]:entity["end"]]
+        return entities
+
+     ##################################################
+     #  get_feature_vectors_2  
+     ################################################## 
+    def get_feature_vectors_2 (self, data_file):        
+
+        print("Loading unlabeled data from file {}".format(data_file))
+        with open(data_file, 'r') as f_data:                                    
+            texts = f_data.readlines()
+
+        # list of list of tokens
+        all_sentences_words = [sentence_words for text_sentences in self.tokenize_texts(texts) \
+                               for sentence_words in text_sentences]
+        
+        self.n_sentences_all = len(all_sentences_words)   
+        print("number of unlabeled examples = {}".format(self.n_sentences_all))
+        return self.create_feature_vectors(all_sentences_words)
+
+    ##################################################
+    #  iterate_unlabeled_chunks
+    #  read the unlabeled file chunk_size lines (texts) at a time
+    #  so that only one chunk is kept in memory
+    ##################################################
+    def iterate_unlabeled_chunks (self, data_file, chunk_size = 10000):
+        print("Streaming unlabeled data from file {}".format(data_file))
+        with open(data_file, 'r') as f_data:
+            while True:
+                texts = list(itertools.islice(f_data, chunk_size))
+                if len(texts) == 0:
+                    break
+                yield texts
+
+    ##################################################
+    #  get_feature_vectors_1  
+    ################################################## 
+    def get_feature_vectors_1 (self, data_list):        
+
+        print("Reading unlabeled data from dataframe")   
+        # list of list of tokens
+        all_sentences_words = [sentence_words for text_sentences in self.tokenize_texts(data_list) \
+                               for sentence_words in text_sentences]
+        
+        self.n_sentences_all = len(all_sentences_words)        
+        print("number of unlabeled examples = {}".format(self.n_sentences_all))
+        return self.create_feature_vectors(all_sentences_words)
+
+    ################################################## 
+    #   create_feature_vectors
+    ################################################## 
+    def create_feature_vectors(self, all_sentences_words):
+        seq_len = self.max_sentence_len_train
+        word_seq_list = []
+        num_truncated = 0
+        for word_seq in all_sentences_words:  
+            if len(word_seq) > seq_len and not self.sliding_window:
+                num_truncated += 1
+                word_seq = word_seq[:seq_len]
+
+            word_seq_list.append(word_seq)
+
+        if num_truncated > 0:
+            print("skip the extra words in {} long sentences".format(num_truncated))
+
+        # Pad the sequences for missing entries to make them all the same length
+        num_tokens_arr = np.array([len(word_seq) for word_seq in word_seq_list], dtype=np.int64)
+        flat_words = [w for word_seq in word_seq_list for w in word_seq]
+        all_X_data, num_unk_words = self.vectorize_flat_words(flat_words, num_tokens_arr, seq_len)
+
+        num_tokens_list = num_tokens_arr.tolist()
+        count = len(flat_words) - num_unk_words
+        
+        print("UNK WORD COUNT = " + str(num_unk_words))
+        print("Found WORDS COUNT = " + str(count))
+        print("TOTAL WORDS = " + str(count+num_unk_words))         
+        
+        print("Done")
+        
+        return (all_X_data, word_seq_list, num_tokens_list)
+
+    ##################################################
+    #   create_feature_vectors_from_offsets
+    #   feature vectors of pre-tokenized sentences given as one flat array
+    #   of tokens and the offsets of the sentences in it: the index of the
+    #   first token of each sentence, optionally followed by the number of
+    #   tokens. The ids are written straight from the flat array unless some
+    #   sentences have to be truncated
+    ##################################################
+    def create_feature_vectors_from_offsets(self, flat_words, offsets):
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if len(offsets) == 0 or offsets[-1] != len(flat_words):
+            offsets = np.append(offsets, len(flat_words))
+        if offsets[0] != 0 or np.any(np.diff(offsets) < 0) or offsets[-1] > len(flat_words):
+            raise ValueError("the offsets must start at 0 and be sorted, and not be larger than the number of tokens")
+
+        word_seq_list = [flat_words[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        num_tokens_arr = np.diff(offsets)
+        seq_len = self.max_sentence_len_train
+        if np.any(num_tokens_arr > seq_len) and not self.sliding_window:
+            return self.create_feature_vectors(word_seq_list)
+
+        all_X_data, num_unk_words = self.vectorize_flat_words(flat_words, num_tokens_arr, seq_len)
+        print("UNK WORD COUNT = " + str(num_unk_words))
+        print("TOTAL WORDS = " + str(len(flat_words)))
+
+        return (all_X_data, word_seq_list, num_tokens_arr.tolist())
@@ -1,253 +1,685 @@
-from keras.preprocessing import sequence
-from keras.models import load_model,save_model
-from keras.models import Sequential
-from keras.layers import Dense, Input
-from keras.layers import LSTM
-from keras.layers import GRU
-from keras.layers.core import Activation
-from keras.regularizers import l2
-from keras.layers.wrappers import TimeDistributed
-from keras.layers.wrappers import Bidirectional
-from keras.layers.normalization import BatchNormalization
-from keras.layers import Embedding
-from keras.layers.core import Dropout
-import numpy as np
-import pandas as pd
-import sys
-import keras.backend as K
-from sklearn.metrics import confusion_matrix, classification_report
-
-# For reproducibility
-np.random.seed(42)
-
-class EntityExtractor:
-
-    def __init__ (self, reader, embedding_pickle_file=None):
-        
-        self.reader = reader
-        self.model = None       
-        
-        if not (embedding_pickle_file is None):
-            self.wordvecs = self.reader.load_embedding_lookup_table(embedding_pickle_file)
- 
-
-    def load (self, filepath):
-        self.model = load_model(filepath)
-        
-    def save (self, filepath):        
-        self.model.save(filepath)
-
-    def print_summary (self):
-        print(self.model.summary())        
-   
-    ##################################################
-    # train
-    ##################################################
-    def train (self, train_file, output_resources_pickle_file, \
-        network_type = 'unidirectional', \
-        num_epochs = 1, batch_size = 50, \
-        dropout = 0.2, reg_alpha = 0.0, \
-        num_hidden_units = 150, num_layers = 1):
-        
-        train_X, train_Y = self.reader.read_and_parse_training_data(train_file, output_resources_pickle_file)       
-
-        print("Data Shape: ")
-        print(train_X.shape)
-        print(train_Y.shape)        
-        
-        print("Hyper parameters:")
-        print("output_resources_pickle_file = {}".format(output_resources_pickle_file))
-        print( "network_type = {}".format(network_type))
-        print( "num_epochs= {}".format(num_epochs ))
-        print("batch_size = {}".format(batch_size ))
-        print("dropout = ".format(dropout ))
-        print("reg_alpha = {}".format(reg_alpha ))
-        print("num_hidden_units = {}".format(num_hidden_units))
-        print("num_layers = {}".format(num_layers ))         
-                
-        self.model = Sequential()        
-        self.model.add(Embedding(self.wordvecs.shape[0], self.wordvecs.shape[1], \
-                                 input_length = train_X.shape[1], \
-                                 weights = [self.wordvecs], trainable = False))                
-
-        for i in range(0, num_layers):
-            if network_type == 'unidirectional':
-                # uni-directional LSTM
-                self.model.add(LSTM(num_hidden_units, return_sequences = True))
-            else:
-                # bi-directional LSTM
-                self.model.add(Bidirectional(LSTM(num_hidden_units, return_sequences = True)))
-        
-            self.model.add(Dropout(dropout))
-
-        self.model.add(TimeDistributed(Dense(train_Y.shape[2], activation='softmax')))
-
-        self.model.compile(loss='categorical_crossentropy', optimizer='adam')
-        print(self.model.summary())
-
-        self.model.fit(train_X, train_Y, epochs = num_epochs, batch_size = batch_size)
-
-    #########################################
-    # predict
-    #########################################            
-    def predict(self, data_frame):
-        import json
-        from collections import OrderedDict as odict
-
-        feat_vector_list, word_seq_list, num_tokens_list = self.reader.preprocess_unlabeled_data(data_frame)
-        print("Data Shape: ")        
-        print(feat_vector_list.shape)
-        # the output is a list of JSON strings
-        predicted_tags= []
-        ind = 0
-        for feat_vector, word_seq, num_tokens in zip(feat_vector_list, word_seq_list, num_tokens_list):
-            prob_dist = self.model.predict(np.array([feat_vector]), batch_size=1)[0]
-            pred_tags = self.reader.decode_prediction_sequence(prob_dist)
-            pred_dict = odict(zip(word_seq[-num_tokens:], pred_tags[-num_tokens:]))
-            pred_str = json.dumps(pred_dict) 
-            predicted_tags.append(pred_str)
-            ind += 1
-            ### To see Progress ###
-            if ind % 100 == 0: 
-                print("Tagging {} sentences".format(ind))
-        
-        #predicted_tags = np.array(predicted_tags)
-        return predicted_tags
-    
-    #########################################
-    # predict_1
-    # read the data from the memory
-    #########################################
-    def predict_1(self, text_list):
-        import json
-        from collections import OrderedDict as odict
-
-        feat_vector_list, word_seq_list, num_tokens_list = self.reader.get_feature_vectors_1(text_list)
-        print("Data Shape: ")        
-        print(feat_vector_list.shape)
-        # the output is a list of JSON strings
-        predicted_tags= []
-        ind = 0
-        for feat_vector, word_seq, num_tokens in zip(feat_vector_list, word_seq_list, num_tokens_list):
-            prob_dist = self.model.predict(np.array([feat_vector]), batch_size=1)[0]
-            pred_tags = self.reader.decode_prediction_sequence(prob_dist)
-            pred_dict = odict(zip(word_seq[-num_tokens:], pred_tags[-num_tokens:]))
-            pred_str = json.dumps(pred_dict) 
-            predicted_tags.append(pred_str)
-            ind += 1
-            ### To see Progress ###
-            if ind % 500 == 0: 
-               print("Tagging {} sentences".format(ind))
-        
-        #predicted_tags = np.array(predicted_tags)
-        return predicted_tags
-    
-    ############################################
-    # predict_2
-    # read the data from a file
-    ###########################################
-    def predict_2(self, data_file):
-        import json
-        from collections import OrderedDict as odict
-
-        feat_vector_list, word_seq_list, num_tokens_list = self.reader.get_feature_vectors_2(data_file)
-        print("Data Shape: ")        
-        print(feat_vector_list.shape)
-        # the output is a list of JSON strings
-        predicted_tags= []
-        ind = 0
-        for feat_vector, word_seq, num_tokens in zip(feat_vector_list, word_seq_list, num_tokens_list):
-            prob_dist = self.model.predict(np.array([feat_vector]), batch_size=1)[0]
-            pred_tags = self.reader.decode_prediction_sequence(prob_dist)
-            pred_dict = odict(zip(word_seq, pred_tags[-num_tokens:]))
-            pred_str = json.dumps(pred_dict) 
-            predicted_tags.append(pred_str)
-            ind += 1
-            ### To see Progress ###
-            if ind % 500 == 0: 
-               print("Tagging {} sentences".format(ind))
-        
-        #predicted_tags = np.array(predicted_tags)
-        return predicted_tags
-    
-    ###########################################
-    # evaluate_model
-    ###########################################
-    def evaluate_model(self, test_file, output_prediction_file):
-        print("evaluate_model - Begin")
-        test_X, test_Y, data_set, num_tokens_list = self.reader.read_and_parse_test_data(test_file)
-        
-        print("Data Shape: ")        
-        print(test_X.shape)
-        print(test_Y.shape)
-        
-        f = open(output_prediction_file, 'w')
-        predicted_tags= []
-        target_tags = []
-        batch_size = 500
-        #for each line        
-        for ind in range(0,len(test_X), batch_size):
-            batch_test_X = test_X[ind:ind+ batch_size]
-            batch_test_Y = test_Y[ind:ind+ batch_size]
-            batch_data_set = data_set[ind:ind+ batch_size]
-            batch_num_tokens_list = num_tokens_list[ind:ind+ batch_size]             
-
-            #ind += 1
-            ### To see Progress ###
-            if ind % 500 == 0: 
-                print("processing sentences = " + str(ind))                                                   
-
-            batch_class_prob_dist = self.model.predict(np.array(batch_test_X), batch_size=batch_size)
-            for class_prob_dist,y,data_point, num_tokens in zip(batch_class_prob_dist, batch_test_Y, batch_data_set, batch_num_tokens_list):
-                sent_predicted_tags = self.reader.decode_prediction_sequence(class_prob_dist)
-                sent_target_tags = self.reader.decode_prediction_sequence(y)
-            
-                #remove padding
-                sent_predicted_tags = sent_predicted_tags[-num_tokens:]
-                sent_target_tags = sent_target_tags[-num_tokens:]
-
-                if len(sent_target_tags) != num_tokens or \
-                    len(sent_predicted_tags) != num_tokens:
-                    print("stop here ............")
-
-                for index in range(0, num_tokens):
-                    target_tag = sent_target_tags[index]
-                    pred_tag = sent_predicted_tags[index]
-
-                    if target_tag != "NONE":
-                        if pred_tag == "B-Chemical":
-                            predicted_tags.append("B-Drug")
-                        elif pred_tag == "I-Chemical":
-                            predicted_tags.append("I-Drug")
-                        elif pred_tag == 'None':
-                            predicted_tags.append('O')
-                        else:
-                            predicted_tags.append(pred_tag)
-                        
-                        if target_tag == "B-Chemical":
-                            target_tags.append("B-Drug")
-                        elif target_tag == "I-Chemical":
-                            target_tags.append("I-Drug")
-                        else:                        
-                            target_tags.append(target_tag)
-      
-                ##for each token
-                for target_tag, predicted_tag, word in zip(sent_target_tags, sent_predicted_tags, list(data_point[0])):
-                    #f.write(word + '\t' + str(target_tag) + '\t' + str(predicted_tag) + '\n')                                             
-                    f.write(str(predicted_tag) + '\n')
-                f.write("\n")                     
-
-        f.close()
-
-        predicted_tags = np.array(predicted_tags)
-        target_tags = np.array(target_tags)
-        evaluation_report = classification_report(target_tags, predicted_tags)
-
-        all_tags = sorted(list(self.reader.tag_to_vector_map.keys()))
-        simple_conf_matrix = confusion_matrix(target_tags, predicted_tags, labels= all_tags)             
-        
-        conf_matrix_df = pd.DataFrame(data=simple_conf_matrix, columns = all_tags, index = all_tags)  
-        
-        print("evaluate_model - End")
-        return evaluation_report, conf_matrix_df
-
+# keras is imported in the methods that need it, so that a model loaded with the
+# numpy inference engine (NumpyModel) can tag sentences without keras and tensorflow
+import numpy as np
+import pandas as pd
+import os
+import sys
+import threading
+from collections import OrderedDict
+import timeit as t
+
+# For reproducibility
+np.random.seed(42)
+
+class EntityExtractor:
+
+    def __init__ (self, reader, embedding_pickle_file=None, num_oov_buckets = 0, prediction_cache_size = 0):
+        
+        self.reader = reader
+        self.model = None       
+        # graph and session of a loaded keras model, pinned around each prediction
+        # so that the model can be used from any thread (None: the defaults)
+        self.graph = None
+        self.session = None
+
+        # LRU cache of the predicted tags keyed by the padded length and the token ids of the sentence (0: no cache)
+        self.prediction_cache_size = prediction_cache_size
+        self.prediction_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # the cache is shared by the threads that call predict_tags
+        self.cache_lock = threading.Lock()
+        
+        if not (embedding_pickle_file is None):
+            self.wordvecs = self.reader.load_embedding_lookup_table(embedding_pickle_file, num_oov_buckets)
+ 
+
+    ##################################################
+    # load
+    # engine = 'keras' loads the keras model, 'numpy' the NumpyModel
+    # inference engine that doesn't import keras nor tensorflow.
+    # mmap_embedding memory-maps the embedding table of the numpy engine
+    ##################################################
+    def load (self, filepath, engine = 'keras', mmap_embedding = False):
+        if engine == 'keras':
+            from keras.models import load_model
+            import keras.backend as K
+            self.model = load_model(filepath)
+            # build the predict function now, not lazily in the first request thread,
+            # and keep the graph and the session it belongs to
+            if hasattr(self.model, '_make_predict_function'):
+                self.model._make_predict_function()
+            if hasattr(K, 'get_session'):
+                self.session = K.get_session()
+                self.graph = self.session.graph
+        elif engine == 'numpy':
+            from NumpyModel import NumpyModel
+            # the numpy model only reads its weights, it can be used from any thread as it is
+            self.model = NumpyModel.load(filepath, mmap_embedding = mmap_embedding)
+            self.graph = None
+            self.session = None
+        else:
+            raise ValueError("Unknown inference engine {}, expected 'keras' or 'numpy'".format(engine))
+        # the cached tags were predicted by the previous model
+        self.clear_prediction_cache()
+
+    def clear_prediction_cache (self):
+        with self.cache_lock:
+            self.prediction_cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
+
+    ##################################################
+    # model_predict
+    # tag probabilities of a batch. Thread-safe: a keras model is run in the
+    # graph and the session it was loaded in, whatever the calling thread
+    ##################################################
+    def model_predict (self, batch_feat_vectors, batch_size = 500):
+        if self.graph is None:
+            return self.model.predict(batch_feat_vectors, batch_size = batch_size)
+
+        with self.graph.as_default(), self.session.as_default():
+            return self.model.predict(batch_feat_vectors, batch_size = batch_size)
+        
+    def save (self, filepath):        
+        self.model.save(filepath)
+
+    def print_summary (self):
+        if hasattr(self.model, 'summary'):
+            print(self.model.summary())
+        else:
+            for class_name, config, weights in self.model.layers:
+                print("{} ({}): {}".format(config['name'], class_name, [w.shape for w in weights]))        
+   
+    ##################################################
+    # train
+    ##################################################
+    def train (self, train_file, output_resources_pickle_file, \
+        network_type = 'unidirectional', \
+        num_epochs = 1, batch_size = 50, \
+        dropout = 0.2, reg_alpha = 0.0, \
+        num_hidden_units = 150, num_layers = 1, \
+        bucketing = False, bucket_width = 8, streaming = False, masking = False, \
+        kernel_size = 3, dilation_rates = (1, 2, 4), \
+        validation_split = 0.0, early_stopping_patience = None, checkpoint_dir = None, resume = False):
+        from keras.models import Sequential
+        from keras.layers import Dense, LSTM, Embedding, Conv1D
+        from keras.layers.core import Dropout
+        from keras.layers.wrappers import TimeDistributed, Bidirectional
+
+        if streaming:
+            # only the tags and the maximum length are read up front, the
+            # mini-batches are vectorized from the file during each epoch
+            self.reader.scan_training_data(train_file, output_resources_pickle_file)
+            max_sentence_len = self.reader.max_sentence_len_train
+        else:
+            train_X, train_Y = self.reader.read_and_parse_training_data(train_file, output_resources_pickle_file)       
+
+            # the labels are class ids, the sparse loss expects them with a trailing axis of size 1
+            train_Y = np.expand_dims(train_Y, -1)
+
+            print("Data Shape: ")
+            print(train_X.shape)
+            print(train_Y.shape)        
+            max_sentence_len = train_X.shape[1]
+
+        # hold out a random share of the training sentences to compute the validation loss after each epoch.
+        # The split has its own seed so that a resumed training gets the same one
+        validation_data = None
+        if validation_split > 0:
+            if streaming:
+                raise ValueError("validation_split is not supported with streaming")
+            permutation = np.random.RandomState(42).permutation(len(train_X))
+            num_validation = int(round(len(train_X) * validation_split))
+            validation_ind, train_ind = np.sort(permutation[:num_validation]), np.sort(permutation[num_validation:])
+            validation_X, validation_Y = train_X[validation_ind], train_Y[validation_ind]
+            train_X, train_Y = train_X[train_ind], train_Y[train_ind]
+            validation_data = (validation_X, validation_Y, self.reader.get_sample_weights(validation_X)) if masking \
+                              else (validation_X, validation_Y)
+            print("training sentences = {}, validation sentences = {}".format(len(train_X), len(validation_X)))
+        if early_stopping_patience is not None and validation_data is None:
+            raise ValueError("early stopping needs a validation_split")
+
+        self.wordvecs = self.reader.wordvecs
+        
+        print("Hyper parameters:")
+        print("output_resources_pickle_file = {}".format(output_resources_pickle_file))
+        print( "network_type = {}".format(network_type))
+        print( "num_epochs= {}".format(num_epochs ))
+        print("batch_size = {}".format(batch_size ))
+        print("dropout = ".format(dropout ))
+        print("reg_alpha = {}".format(reg_alpha ))
+        print("num_hidden_units = {}".format(num_hidden_units))
+        print("num_layers = {}".format(num_layers ))         
+        print("bucketing = {}".format(bucketing ))
+        print("streaming = {}".format(streaming ))
+        print("masking = {}".format(masking ))
+        print("validation_split = {}".format(validation_split))
+        print("early_stopping_patience = {}".format(early_stopping_patience))
+        print("checkpoint_dir = {}".format(checkpoint_dir))
+        if network_type == 'dilated_cnn':
+            print("kernel_size = {}".format(kernel_size))
+            print("dilation_rates = {}".format(dilation_rates))
+                
+        # the masked model skips the paddings, which must have the reserved id 0
+        if masking and self.reader.zero_vec_pos != 0:
+            raise ValueError("masking needs the padding id 0, the lookup table has the padding at row {}".format(self.reader.zero_vec_pos))
+        # the keras convolutions don't support masks
+        if masking and network_type == 'dilated_cnn':
+            raise ValueError("masking is only supported by the LSTM network types")
+
+        # with bucketing the batches have different lengths so the input length is left open
+        input_length = None if bucketing else max_sentence_len
+
+        # the arguments that define the model and its training data, saved with the checkpoints.
+        # A checkpoint is only resumed with the same ones (num_epochs can be raised)
+        training_arguments = {"train_file": os.path.abspath(train_file), "network_type": network_type, \
+                              "batch_size": batch_size, "dropout": dropout, "reg_alpha": reg_alpha, \
+                              "num_hidden_units": num_hidden_units, "num_layers": num_layers, \
+                              "bucketing": bucketing, "bucket_width": bucket_width, "streaming": streaming, \
+                              "masking": masking, "validation_split": validation_split, \
+                              "lookup_table_shape": [int(dim) for dim in self.wordvecs.shape]}
+        if network_type == 'dilated_cnn':
+            training_arguments.update({"kernel_size": kernel_size, "dilation_rates": list(dilation_rates)})
+
+        # resume from the last checkpoint, with the optimizer state saved with the model
+        checkpoint_state = self.read_checkpoint_state(checkpoint_dir) if resume else None
+        if checkpoint_state is not None and checkpoint_state.get("arguments") != training_arguments:
+            saved_arguments = checkpoint_state.get("arguments") or {}
+            differences = sorted(name for name in set(training_arguments) | set(saved_arguments) \
+                                 if saved_arguments.get(name) != training_arguments.get(name))
+            raise ValueError("The checkpoint in {} was trained with other arguments ({}), it can't be resumed".format( \
+                             checkpoint_dir, ", ".join(differences)))
+        initial_epoch = 0
+        # the cached tags were predicted by the previous model
+        self.clear_prediction_cache()
+        if checkpoint_state is not None:
+            from keras.models import load_model
+            checkpoint_file = self.get_checkpoint_file(checkpoint_dir, checkpoint_state["epoch"])
+            print("Resuming the training after epoch {} from the checkpoint {}".format(checkpoint_state["epoch"], checkpoint_file))
+            self.model = load_model(checkpoint_file)
+            initial_epoch = checkpoint_state["epoch"]
+        else:
+            self.model = Sequential()        
+            self.model.add(Embedding(self.wordvecs.shape[0], self.wordvecs.shape[1], \
+                                     input_length = input_length, \
+                                     weights = [self.wordvecs], trainable = False, \
+                                     mask_zero = masking))                
+
+            for i in range(0, num_layers):
+                if network_type == 'unidirectional':
+                    # uni-directional LSTM
+                    self.model.add(LSTM(num_hidden_units, return_sequences = True))
+                elif network_type == 'dilated_cnn':
+                    # iterated dilated CNN: each layer is a block of convolutions whose dilation
+                    # grows (1, 2, 4: a block sees 15 words with kernel_size 3). Unlike the LSTMs,
+                    # all the positions of the sentence are computed at the same time
+                    for dilation_rate in dilation_rates:
+                        self.model.add(Conv1D(num_hidden_units, kernel_size, padding = 'same', \
+                                              dilation_rate = dilation_rate, activation = 'relu'))
+                else:
+                    # bi-directional LSTM
+                    self.model.add(Bidirectional(LSTM(num_hidden_units, return_sequences = True)))
+        
+                self.model.add(Dropout(dropout))
+
+            self.model.add(TimeDistributed(Dense(self.reader.num_classes, activation='softmax')))
+
+            # with masking, the temporal sample weights keep the paddings out of the loss
+            sample_weight_mode = 'temporal' if masking else None
+            self.model.compile(loss='sparse_categorical_crossentropy', optimizer='adam', sample_weight_mode = sample_weight_mode)
+        print(self.model.summary())
+
+        if checkpoint_dir is not None and not os.path.exists(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        num_train_sentences = self.reader.n_sentences_all if streaming else len(train_X)
+        training_state, callbacks = self.create_training_callbacks(num_train_sentences, early_stopping_patience, \
+                                                                   checkpoint_dir, checkpoint_state, training_arguments)
+
+        if streaming:
+            steps_per_epoch = int(np.ceil(self.reader.n_sentences_all / float(batch_size)))
+            self.model.fit_generator(self.reader.generate_training_batches(train_file, batch_size, pad_to_batch_max = bucketing, \
+                                                                           sample_weights = masking), \
+                                     steps_per_epoch = steps_per_epoch, epochs = num_epochs, \
+                                     callbacks = callbacks, initial_epoch = initial_epoch)
+        elif bucketing:
+            num_tokens_list = self.reader.get_num_tokens(train_X)
+            batches = self.reader.create_length_buckets(num_tokens_list, batch_size, bucket_width)
+            print("number of length buckets batches = {}".format(len(batches)))
+            self.model.fit_generator(self.reader.generate_bucketed_batches(train_X, train_Y, batches, sample_weights = masking), \
+                                     steps_per_epoch = len(batches), epochs = num_epochs, validation_data = validation_data, \
+                                     callbacks = callbacks, initial_epoch = initial_epoch)
+        else:
+            sample_weight = self.reader.get_sample_weights(train_X) if masking else None
+            self.model.fit(train_X, train_Y, epochs = num_epochs, batch_size = batch_size, sample_weight = sample_weight, \
+                           validation_data = validation_data, callbacks = callbacks, initial_epoch = initial_epoch)
+
+        # with early stopping, keep the weights of the epoch with the lowest validation loss
+        best_epoch = training_state["best_epoch"]
+        if early_stopping_patience is not None and best_epoch is not None and best_epoch != training_state["epoch"]:
+            print("Restoring the weights of epoch {} (validation loss = {})".format(best_epoch, training_state["best_val_loss"]))
+            if training_state["best_weights"] is not None:
+                self.model.set_weights(training_state["best_weights"])
+            else:
+                self.model.load_weights(self.get_checkpoint_file(checkpoint_dir, best_epoch))
+
+    ##################################################
+    # create_training_callbacks
+    # keras callback run after each epoch: it logs the epoch time and the
+    # training throughput, saves the checkpoint of the epoch (the model
+    # with its optimizer state), only keeping the last and the best ones,
+    # and stops the training when the validation loss hasn't improved for
+    # early_stopping_patience epochs. The state (last epoch, best validation
+    # loss, training arguments) is restored when resuming
+    ##################################################
+    def create_training_callbacks(self, num_train_sentences, early_stopping_patience = None, \
+                                  checkpoint_dir = None, checkpoint_state = None, training_arguments = None):
+        from keras.callbacks import LambdaCallback
+
+        training_state = {"epoch": 0, "best_epoch": None, "best_val_loss": None, "wait": 0, "arguments": training_arguments}
+        if checkpoint_state is not None:
+            training_state.update(checkpoint_state)
+        # the best weights are kept in memory when there are no checkpoints to reload them from
+        training_state["best_weights"] = None
+        epoch_start = [0.0]
+
+        def on_epoch_begin(epoch, logs):
+            epoch_start[0] = t.default_timer()
+
+        def on_epoch_end(epoch, logs):
+            epoch_time = t.default_timer() - epoch_start[0]
+            logs = logs or {}
+            training_state["epoch"] = epoch + 1
+            print("epoch {}: {} s, {} sentences/s, loss = {}, val_loss = {}".format(epoch + 1, round(epoch_time, 2), \
+                  round(num_train_sentences / epoch_time, 1), logs.get("loss"), logs.get("val_loss")))
+
+            val_loss = logs.get("val_loss")
+            if val_loss is not None:
+                if training_state["best_val_loss"] is None or val_loss < training_state["best_val_loss"]:
+                    training_state.update({"best_epoch": epoch + 1, "best_val_loss": float(val_loss), "wait": 0})
+                    if checkpoint_dir is None and early_stopping_patience is not None:
+                        training_state["best_weights"] = self.model.get_weights()
+                else:
+                    training_state["wait"] += 1
+
+            if checkpoint_dir is not None:
+                self.model.save(self.get_checkpoint_file(checkpoint_dir, epoch + 1))
+                self.write_checkpoint_state(checkpoint_dir, training_state)
+                self.remove_old_checkpoints(checkpoint_dir, [epoch + 1, training_state["best_epoch"]])
+
+            if early_stopping_patience is not None and training_state["wait"] >= early_stopping_patience:
+                print("Early stopping: no improvement of the validation loss for {} epochs".format(training_state["wait"]))
+                self.model.stop_training = True
+
+        return training_state, [LambdaCallback(on_epoch_begin = on_epoch_begin, on_epoch_end = on_epoch_end)]
+
+    ##################################################
+    # checkpoints
+    # checkpoint_<epoch>.h5 files and checkpoint_state.json, which names
+    # the last complete epoch, in checkpoint_dir. Each checkpoint holds the
+    # whole lookup table, only the last and the best epochs are kept
+    ##################################################
+    def get_checkpoint_file(self, checkpoint_dir, epoch):
+        return os.path.join(checkpoint_dir, "checkpoint_{:03d}.h5".format(epoch))
+
+    def write_checkpoint_state(self, checkpoint_dir, training_state):
+        import json
+        state = {key: value for key, value in training_state.items() if key != "best_weights"}
+        # written once the checkpoint file is complete, and replaced in one step
+        tmp_state_file = os.path.join(checkpoint_dir, "checkpoint_state.json.tmp")
+        with open(tmp_state_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_state_file, os.path.join(checkpoint_dir, "checkpoint_state.json"))
+
+    def remove_old_checkpoints(self, checkpoint_dir, keep_epochs):
+        keep_files = set(os.path.basename(self.get_checkpoint_file(checkpoint_dir, epoch)) for epoch in keep_epochs if epoch is not None)
+        for name in os.listdir(checkpoint_dir):
+            if name.startswith("checkpoint_") and name.endswith(".h5") and name not in keep_files:
+                os.remove(os.path.join(checkpoint_dir, name))
+
+    def read_checkpoint_state(self, checkpoint_dir):
+        import json
+        state_file = os.path.join(checkpoint_dir, "checkpoint_state.json") if checkpoint_dir is not None else None
+        if state_file is None or not os.path.exists(state_file):
+            print("No checkpoint to resume from, training from scratch")
+            return None
+        with open(state_file, 'r') as f:
+            return json.load(f)
+
+    #########################################
+    # predict_tags
+    # tags of each sentence of the feature matrix. When the rows are the
+    # windows of sentences longer than max_sentence_len_train (only found
+    # with the reader's sliding_window option, see DataReader.cut_windows),
+    # the windows are tagged and stitched back into sentences. With the
+    # prediction cache enabled, the sentences already tagged with the same
+    # padding are answered from the cache and only the others are run
+    # through the model
+    #########################################
+    def predict_tags(self, feat_vector_list, num_tokens_list, batch_size = 500, bucketing = False, bucket_width = 8):
+        if self.reader.has_windows(num_tokens_list):
+            window_num_tokens = self.reader.get_window_num_tokens(num_tokens_list)
+            print("Tagging {} windows of {} sentences".format(len(window_num_tokens), len(num_tokens_list)))
+            window_tags = self.predict_tags(feat_vector_list, window_num_tokens, batch_size, bucketing, bucket_width)
+            return self.reader.stitch_windows(window_tags, num_tokens_list)
+
+        if self.prediction_cache_size <= 0:
+            return self.run_model(feat_vector_list, num_tokens_list, batch_size, bucketing, bucket_width)
+
+        predicted_tags = [None] * len(feat_vector_list)
+        # sentences to run through the model: key -> positions in the input
+        missed = OrderedDict()
+        # the padding can change the tags of a model without masking: the key holds the padded length,
+        # the length bucket with bucketing, and the token ids
+        padded_len = ("bucket", bucket_width) if bucketing else np.shape(feat_vector_list)[1]
+        keys = [(padded_len, tuple(row[len(row) - num_tokens:].tolist())) for row, num_tokens in zip(feat_vector_list, num_tokens_list)]
+        with self.cache_lock:
+            for sent_index, key in enumerate(keys):
+                sent_tags = self.prediction_cache.get(key)
+                if sent_tags is not None:
+                    self.prediction_cache.move_to_end(key)
+                    predicted_tags[sent_index] = list(sent_tags)
+                    self.cache_hits += 1
+                else:
+                    missed.setdefault(key, []).append(sent_index)
+                    self.cache_misses += 1
+
+        # the model runs outside of the lock so that other threads can use the cache meanwhile
+        if len(missed) > 0:
+            # repeated sentences of the input are only predicted once
+            first_indices = [sent_indices[0] for sent_indices in missed.values()]
+            missed_tags = self.run_model(np.asarray(feat_vector_list)[first_indices], \
+                                         [num_tokens_list[sent_index] for sent_index in first_indices], \
+                                         batch_size, bucketing, bucket_width)
+
+            with self.cache_lock:
+                for (key, sent_indices), sent_tags in zip(missed.items(), missed_tags):
+                    for sent_index in sent_indices:
+                        predicted_tags[sent_index] = list(sent_tags)
+
+                    self.prediction_cache[key] = tuple(sent_tags)
+                    if len(self.prediction_cache) > self.prediction_cache_size:
+                        self.prediction_cache.popitem(last = False)
+
+        return predicted_tags
+
+    #########################################
+    # run_model
+    # run the model over the whole feature matrix in chunks of
+    # batch_size sentences and decode each chunk right after it is predicted.
+    # With bucketing, sentences of similar length are batched together and
+    # each batch is only padded to its longest sentence
+    #########################################
+    def run_model(self, feat_vector_list, num_tokens_list, batch_size = 500, bucketing = False, bucket_width = 8):
+        if bucketing and self.model.input_shape[1] is not None:
+            print("The model was trained with a fixed input length of {}, bucketing is turned off".format(self.model.input_shape[1]))
+            bucketing = False
+
+        if bucketing:
+            # each batch only keeps the last seq_len columns of the left padded rows
+            batches = self.reader.create_length_buckets(num_tokens_list, batch_size, bucket_width)
+        else:
+            batches = [(np.arange(ind, min(ind + batch_size, len(feat_vector_list))), None) \
+                       for ind in range(0, len(feat_vector_list), batch_size)]
+
+        # the output is a list of tag lists with the padding removed, in the input order
+        predicted_tags = [None] * len(feat_vector_list)
+        num_tagged = 0
+        for sent_indices, seq_len in batches:
+            if seq_len is None:
+                batch_feat_vectors = np.asarray(feat_vector_list[sent_indices[0]:sent_indices[-1] + 1])
+            else:
+                batch_feat_vectors = np.asarray(feat_vector_list)[sent_indices, -seq_len:]
+
+            batch_prob_dist = self.model_predict(batch_feat_vectors, batch_size = batch_size)
+            batch_num_tokens_list = [num_tokens_list[sent_index] for sent_index in sent_indices]
+            batch_pred_tags = self.reader.decode_prediction_batch(batch_prob_dist, batch_num_tokens_list)
+            for sent_index, pred_tags in zip(sent_indices, batch_pred_tags):
+                predicted_tags[sent_index] = pred_tags
+
+            ### To see Progress ###
+            num_tagged += len(sent_indices)
+            print("Tagging {} sentences".format(num_tagged))
+
+        return predicted_tags
+
+    #########################################
+    # tag_sentences
+    # build one JSON string (word -> tag) per sentence
+    #########################################
+    def tag_sentences(self, feat_vector_list, word_seq_list, num_tokens_list, batch_size = 500, bucketing = False):
+        import json
+        from collections import OrderedDict as odict
+
+        print("Data Shape: ")        
+        print(feat_vector_list.shape)
+
+        # the output is a list of JSON strings
+        predicted_tags = []
+        sent_tags_list = self.predict_tags(feat_vector_list, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+        for sent_tags, word_seq, num_tokens in zip(sent_tags_list, word_seq_list, num_tokens_list):
+            pred_dict = odict(zip(word_seq[len(word_seq) - num_tokens:], sent_tags))
+            pred_str = json.dumps(pred_dict) 
+            predicted_tags.append(pred_str)
+
+        return predicted_tags
+
+    #########################################
+    # extract_entities
+    # compact output: the list of the entities of each text, merged from
+    # the B- and I- tags, as {"start", "end", "type", "text"} dicts with
+    # the character offsets of the entities in the text. Unlike the word ->
+    # tag JSON strings, the O tokens are dropped and repeated words are kept
+    #########################################
+    def extract_entities(self, text_list, batch_size = 500, bucketing = False):
+        text_list = list(text_list)
+        text_sentences_list = self.reader.tokenize_texts(text_list)
+        all_sentences_words = [sentence_words for text_sentences in text_sentences_list \
+                               for sentence_words in text_sentences]
+        self.reader.n_sentences_all = len(all_sentences_words)
+        if len(all_sentences_words) == 0:
+            return [[] for text in text_list]
+
+        feat_vector_list, word_seq_list, num_tokens_list = self.reader.create_feature_vectors(all_sentences_words)
+        sent_tags_list = self.predict_tags(feat_vector_list, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+
+        entities_list = []
+        sent_ind = 0
+        for text, text_sentences in zip(text_list, text_sentences_list):
+            entities = []
+            for token_offsets in self.reader.get_token_offsets(text, text_sentences):
+                entities.extend(self.reader.get_entity_spans(text, token_offsets, sent_tags_list[sent_ind]))
+                sent_ind += 1
+            entities_list.append(entities)
+        return entities_list
+
+    #########################################
+    # predict
+    #########################################            
+    def predict(self, data_frame, batch_size = 500, bucketing = False):
+        feat_vector_list, word_seq_list, num_tokens_list = self.reader.preprocess_unlabeled_data(data_frame)
+        return self.tag_sentences(feat_vector_list, word_seq_list, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+    
+    #########################################
+    # predict_1
+    # read the data from the memory. output_format 'json' returns one
+    # word -> tag JSON string per sentence, 'spans' the entities of each
+    # text (see extract_entities)
+    #########################################
+    def predict_1(self, text_list, batch_size = 500, bucketing = False, output_format = 'json'):
+        if output_format == 'spans':
+            return self.extract_entities(text_list, batch_size = batch_size, bucketing = bucketing)
+        feat_vector_list, word_seq_list, num_tokens_list = self.reader.get_feature_vectors_1(text_list)
+        return self.tag_sentences(feat_vector_list, word_seq_list, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+    
+    #########################################
+    # predict_tokens
+    # tag pre-tokenized sentences without running the NLTK sentence and
+    # word tokenizers: either a list of token lists (one per sentence), or
+    # a flat array of tokens and the offsets of the sentences in it (see
+    # DataReader.create_feature_vectors_from_offsets). output_format 'json'
+    # returns one word -> tag JSON string per sentence, 'tags' the list of
+    # the tags of each sentence, aligned with its tokens
+    #########################################
+    def predict_tokens(self, sentences, offsets = None, batch_size = 500, bucketing = False, output_format = 'json'):
+        if offsets is None:
+            feat_vector_list, word_seq_list, num_tokens_list = self.reader.create_feature_vectors(list(sentences))
+        else:
+            feat_vector_list, word_seq_list, num_tokens_list = self.reader.create_feature_vectors_from_offsets(sentences, offsets)
+        self.reader.n_sentences_all = len(num_tokens_list)
+
+        if output_format == 'tags':
+            return self.predict_tags(feat_vector_list, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+        return self.tag_sentences(feat_vector_list, word_seq_list, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+
+    ############################################
+    # predict_2
+    # read the data from a file, one text per line
+    ###########################################
+    def predict_2(self, data_file, batch_size = 500, bucketing = False, output_format = 'json'):
+        if output_format == 'spans':
+            print("Loading unlabeled data from file {}".format(data_file))
+            with open(data_file, 'r') as f_data:
+                return self.extract_entities(f_data.readlines(), batch_size = batch_size, bucketing = bucketing)
+        feat_vector_list, word_seq_list, num_tokens_list = self.reader.get_feature_vectors_2(data_file)
+        return self.tag_sentences(feat_vector_list, word_seq_list, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+    
+    ############################################
+    # predict_2_to_file
+    # streaming version of predict_2: read the data file in chunks of
+    # chunk_size lines, tag each chunk and append one line
+    # "<sentence index>\t<JSON string>" per sentence to the output file,
+    # so the memory used does not grow with the size of the input. The
+    # tokenizer processes are started once for the whole file
+    ###########################################
+    def predict_2_to_file(self, data_file, output_file, chunk_size = 10000, batch_size = 500, bucketing = False):
+        num_sentences = 0
+        start = t.default_timer()
+        tokenizer_pool = self.reader.create_tokenizer_pool()
+        try:
+            with open(output_file, 'w') as f_out:
+                for texts in self.reader.iterate_unlabeled_chunks(data_file, chunk_size):
+                    all_sentences_words = [sentence_words for text_sentences in self.reader.tokenize_texts(texts, tokenizer_pool) \
+                                           for sentence_words in text_sentences]
+                    if len(all_sentences_words) == 0:
+                        continue
+
+                    feat_vector_list, word_seq_list, num_tokens_list = self.reader.create_feature_vectors(all_sentences_words)
+                    predicted_tags = self.tag_sentences(feat_vector_list, word_seq_list, num_tokens_list, \
+                                                        batch_size = batch_size, bucketing = bucketing)
+                    for pred_str in predicted_tags:
+                        f_out.write("{}\t{}\n".format(num_sentences, pred_str))
+                        num_sentences += 1
+                    f_out.flush()
+
+                    ### To see Progress ###
+                    elapsed = t.default_timer() - start
+                    print("Tagged {} sentences in {} s ({} sentences/s)".format(num_sentences, round(elapsed, 2), \
+                          round(num_sentences / elapsed, 1)))
+        finally:
+            if tokenizer_pool is not None:
+                tokenizer_pool.terminate()
+
+        self.reader.n_sentences_all = num_sentences
+        return num_sentences
+
+    ###########################################
+    # evaluate_model
+    ###########################################
+    def evaluate_model(self, test_file, output_prediction_file, batch_size = 500, bucketing = False):
+        from sklearn.metrics import confusion_matrix, classification_report
+
+        print("evaluate_model - Begin")
+        test_X, test_Y, data_set, num_tokens_list = self.reader.read_and_parse_test_data(test_file)
+        
+        print("Data Shape: ")        
+        print(test_X.shape)
+        print(test_Y.shape)
+        
+        all_predicted_tags = self.predict_tags(test_X, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+
+        all_target_tags = None
+        if self.reader.has_windows(num_tokens_list):
+            # the rows of the long sentences are their windows, stitch the target tags like the predicted ones
+            window_num_tokens = self.reader.get_window_num_tokens(num_tokens_list)
+            all_target_tags = self.reader.stitch_windows(self.reader.decode_class_id_batch(test_Y, window_num_tokens), num_tokens_list)
+
+        f = open(output_prediction_file, 'w')
+        predicted_tags= []
+        target_tags = []
+        #for each line        
+        for ind in range(0,len(data_set), batch_size):
+            batch_data_set = data_set[ind:ind+ batch_size]
+            batch_num_tokens_list = num_tokens_list[ind:ind+ batch_size]             
+            batch_predicted_tags = all_predicted_tags[ind:ind+ batch_size]
+            if all_target_tags is None:
+                batch_target_tags = self.reader.decode_class_id_batch(test_Y[ind:ind+ batch_size], batch_num_tokens_list)
+            else:
+                batch_target_tags = all_target_tags[ind:ind+ batch_size]
+
+            ### To see Progress ###
+            print("processing sentences = " + str(ind))                                                   
+
+            for sent_predicted_tags,sent_target_tags,data_point, num_tokens in zip(batch_predicted_tags, batch_target_tags, batch_data_set, batch_num_tokens_list):
+                if len(sent_target_tags) != num_tokens or \
+                    len(sent_predicted_tags) != num_tokens:
+                    print("stop here ............")
+
+                for index in range(0, num_tokens):
+                    target_tag = sent_target_tags[index]
+                    pred_tag = sent_predicted_tags[index]
+
+                    if target_tag != "NONE":
+                        if pred_tag == "B-Chemical":
+                            predicted_tags.append("B-Drug")
+                        elif pred_tag == "I-Chemical":
+                            predicted_tags.append("I-Drug")
+                        elif pred_tag == 'None':
+                            predicted_tags.append('O')
+                        else:
+                            predicted_tags.append(pred_tag)
+                        
+                        if target_tag == "B-Chemical":
+                            target_tags.append("B-Drug")
+                        elif target_tag == "I-Chemical":
+                            target_tags.append("I-Drug")
+                        else:                        
+                            target_tags.append(target_tag)
+      
+                ##for each token
+                for target_tag, predicted_tag, word in zip(sent_target_tags, sent_predicted_tags, list(data_point[0])):
+                    #f.write(word + '\t' + str(target_tag) + '\t' + str(predicted_tag) + '\n')                                             
+                    f.write(str(predicted_tag) + '\n')
+                f.write("\n")                     
+
+        f.close()
+
+        predicted_tags = np.array(predicted_tags)
+        target_tags = np.array(target_tags)
+        evaluation_report = classification_report(target_tags, predicted_tags)
+
+        all_tags = sorted(list(self.reader.tag_to_id_map.keys()))
+        simple_conf_matrix = confusion_matrix(target_tags, predicted_tags, labels= all_tags)             
+        
+        conf_matrix_df = pd.DataFrame(data=simple_conf_matrix, columns = all_tags, index = all_tags)  
+        
+        print("evaluate_model - End")
+        return evaluation_report, conf_matrix_df
+
+    ###########################################
+    # get_entity_scores
+    # micro averaged precision, recall and F1 score of the entity tags
+    # (all the tags but O and NONE) from the confusion matrix of evaluate_model
+    ###########################################
+    def get_entity_scores(self, conf_matrix_df):
+        entity_tags = [tag for tag in conf_matrix_df.index if tag not in ('O', 'NONE')]
+        conf_matrix = conf_matrix_df.loc[entity_tags, entity_tags].values
+        true_positives = float(np.trace(conf_matrix))
+        num_predicted = float(conf_matrix_df[entity_tags].values.sum())
+        num_targets = float(conf_matrix_df.loc[entity_tags].values.sum())
+
+        precision = true_positives / num_predicted if num_predicted > 0 else 0.0
+        recall = true_positives / num_targets if num_targets > 0 else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+        return precision, recall, f1
+
@@ -0,0 +1,100 @@
+import re
+
+class FastTokenizer:
+    '''
+    Word tokenizer that reproduces the splits of nltk.word_tokenize on a
+    sentence, using the rules of NLTK's NLTKWordTokenizer (the improved
+    Treebank tokenizer) as precompiled regular expressions.
+
+    It is faster than nltk.word_tokenize because:
+    - it doesn't run the Punkt sentence tokenizer again on each sentence
+      (the input is already split with sent_tokenize),
+    - sentences made of words, numbers and hyphens only are split on white
+      space directly,
+    - each rule only runs if the text contains the characters it can match.
+    '''
+
+    # (characters that must be in the text, pattern, substitution)
+    STARTING_QUOTES = [
+        ("«“‘„`", re.compile("([«“‘„]|[`]+)"), r" \1 "),
+        ('"', re.compile(r'^"'), r"``"),
+        ("`", re.compile(r"(``)"), r" \1 "),
+        ("\"'", re.compile(r"([ \(\[{<])(\"|\'{2})"), r"\1 `` "),
+        ("'", re.compile(r"(?i)(?<!\w)(\')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)"), r"\1 "),
+    ]
+
+    PUNCTUATION = [
+        (".", re.compile(r'([^\.])(\.)([\]\)}>"\'' "»”’ " r"]*)\s*$"), r"\1 \2 \3 "),
+        (":,", re.compile(r"([:,])([^\d])"), r" \1 \2"),
+        (":,", re.compile(r"([:,])$"), r" \1 "),
+        (".", re.compile(r"\.{2,}"), r" \g<0> "),
+        (";@#$%&", re.compile(r"[;@#$%&]"), r" \g<0> "),
+        ("\u2012\u2013\u2014\u2015", re.compile(r"[\u2012-\u2015]"), r" \g<0> "),
+        (".", re.compile(r'([^\.])(\.)([\]\)}>"\']*)\s*$'), r"\1 \2\3 "),
+        ("?!", re.compile(r"[?!]"), r" \g<0> "),
+        ("'", re.compile(r"([^'])' "), r"\1 ' "),
+        ("*", re.compile(r"[*]"), r" \g<0> "),
+        ("[](){}<>", re.compile(r"[\]\[\(\)\{\}\<\>]"), r" \g<0> "),
+        ("-", re.compile(r"--"), r" -- "),
+    ]
+
+    # applied after padding the text with a space on both sides
+    ENDING_QUOTES = [
+        ("»”’", re.compile("([»”’])"), r" \1 "),
+        ("'", re.compile(r"''"), " '' "),
+        ('"', re.compile(r'"'), " '' "),
+        ("'", re.compile(r"\s+"), " "),
+        ("'", re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+        ("'", re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+    ]
+
+    # contractions adapted from Robert MacIntyre's tokenizer
+    CONTRACTIONS = [
+        re.compile(r"(?i)\b(can)(?#X)(not)\b"),
+        re.compile(r"(?i)\b(d)(?#X)('ye)\b"),
+        re.compile(r"(?i)\b(gim)(?#X)(me)\b"),
+        re.compile(r"(?i)\b(gon)(?#X)(na)\b"),
+        re.compile(r"(?i)\b(got)(?#X)(ta)\b"),
+        re.compile(r"(?i)\b(lem)(?#X)(me)\b"),
+        re.compile(r"(?i)\b(more)(?#X)('n)\b"),
+        re.compile(r"(?i)\b(wan)(?#X)(na)(?=\s)"),
+        re.compile(r"(?i) ('t)(?#X)(is)\b"),
+        re.compile(r"(?i) ('t)(?#X)(was)\b"),
+    ]
+    HAS_CONTRACTION = re.compile(r"(?i)cannot|d'ye|gimme|gonna|gotta|lemme|more'n|wanna|'tis|'twas")
+
+    # sentences that none of the rules can change except the final period
+    PLAIN_SENTENCE = re.compile(r"[\w\s/+=~^|-]*[\w/+=~^|]\.?\s*")
+
+    def tokenize (self, text):
+        if self.PLAIN_SENTENCE.fullmatch(text) and "--" not in text and not self.HAS_CONTRACTION.search(text):
+            text = text.rstrip()
+            if text.endswith("."):
+                return text[:-1].split() + ["."]
+            return text.split()
+
+        for chars, regexp, substitution in self.STARTING_QUOTES:
+            if self.contains_any(text, chars):
+                text = regexp.sub(substitution, text)
+
+        for chars, regexp, substitution in self.PUNCTUATION:
+            if self.contains_any(text, chars):
+                text = regexp.sub(substitution, text)
+
+        text = " " + text + " "
+
+        for chars, regexp, substitution in self.ENDING_QUOTES:
+            if self.contains_any(text, chars):
+                text = regexp.sub(substitution, text)
+
+        if self.HAS_CONTRACTION.search(text):
+            for regexp in self.CONTRACTIONS:
+                text = regexp.sub(r" \1 \2 ", text)
+
+        return text.split()
+
+    def contains_any (self, text, chars):
+        for c in chars:
+            if c in text:
+                return True
+        return False
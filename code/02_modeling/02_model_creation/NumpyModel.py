@@ -0,0 +1,273 @@
+import json
+import numpy as np
+import h5py
+
+class NumpyModel:
+    '''
+    Inference-only version of the entity extraction network that runs the
+    forward pass with numpy. The weights and the layer configuration are read
+    with h5py from the .h5 file saved by EntityExtractor, so neither keras nor
+    tensorflow is imported.
+
+    It supports the layers that EntityExtractor.train builds: Embedding,
+    LSTM, Bidirectional(LSTM), Conv1D (with dilation), Dropout (a no-op at
+    inference) and TimeDistributed(Dense). Like the keras model, it has an input_shape and a
+    predict method that returns the tag probabilities of a batch.
+
+    It also loads the models written by quantize_model.py, whose embedding
+    table is stored as float16 or as int8 with one float32 scale per row.
+
+    With mmap_embedding set, the embedding table is memory-mapped from the
+    .h5 file instead of being read into memory, so the processes that load
+    the same model file share its pages through the OS page cache.
+    '''
+
+    def __init__ (self, layers, input_shape):
+        # list of (class name, layer config, list of weight arrays)
+        self.layers = layers
+        self.input_shape = input_shape
+
+    ##################################################
+    # load
+    ##################################################
+    @classmethod
+    def load (cls, filepath, mmap_embedding = False):
+        with h5py.File(filepath, mode='r') as f:
+            model_config = f.attrs['model_config']
+            if isinstance(model_config, bytes):
+                model_config = model_config.decode('utf-8')
+            model_config = json.loads(model_config)
+
+            if model_config['class_name'] != 'Sequential':
+                raise ValueError("Only Sequential models are supported, found {}".format(model_config['class_name']))
+
+            # keras < 2.2 stores the list of layers directly, later versions under "layers"
+            layer_configs = model_config['config']
+            if isinstance(layer_configs, dict):
+                layer_configs = layer_configs['layers']
+
+            weights_group = f['model_weights'] if 'model_weights' in f else f
+            layers = []
+            for layer_config in layer_configs:
+                class_name, config = layer_config['class_name'], layer_config['config']
+                if class_name not in cls.LAYER_TYPES:
+                    raise ValueError("Unsupported layer {} ({})".format(config['name'], class_name))
+
+                weights = []
+                if config['name'] in weights_group:
+                    layer_group = weights_group[config['name']]
+                    for weight_name in layer_group.attrs['weight_names']:
+                        if isinstance(weight_name, bytes):
+                            weight_name = weight_name.decode('utf-8')
+                        dataset = layer_group[weight_name]
+                        # a quantized embedding table stays int8 or float16 in memory
+                        if class_name == 'Embedding' and dataset.dtype in (np.int8, np.float16, np.float32):
+                            weight = cls.map_dataset(filepath, dataset) if mmap_embedding else None
+                            if weight is None:
+                                weight = np.asarray(dataset)
+                        else:
+                            weight = np.asarray(dataset).astype(np.float32)
+                        weights.append(weight)
+
+                layers.append((class_name, config, weights))
+
+        input_shape = tuple(layer_configs[0]['config'].get('batch_input_shape', (None, None)))
+        return cls(layers, input_shape)
+
+    ##################################################
+    # map_dataset
+    # read-only memmap of an h5py dataset, None when the dataset
+    # isn't stored in one contiguous uncompressed block of the file
+    ##################################################
+    @staticmethod
+    def map_dataset (filepath, dataset):
+        offset = dataset.id.get_offset()
+        if offset is None or dataset.chunks is not None or dataset.compression is not None:
+            return None
+        return np.memmap(filepath, mode='r', dtype=dataset.dtype, shape=dataset.shape, offset=offset)
+
+    ##################################################
+    # predict
+    # probability of each tag for each token of a batch of
+    # token id rows, shape (batch, sentence length, number of tags)
+    ##################################################
+    def predict (self, X, batch_size = 500):
+        X = np.asarray(X, dtype=np.int64)
+        if len(X) == 0:
+            return self.predict_batch(X)
+        return np.concatenate([self.predict_batch(X[ind:ind + batch_size]) for ind in range(0, len(X), batch_size)])
+
+    def predict_batch (self, X):
+        h, mask = X, None
+        for class_name, config, weights in self.layers:
+            h, mask = self.LAYER_TYPES[class_name](self, h, mask, config, weights)
+        return h
+
+    ##################################################
+    # layers
+    # each one maps (input, mask) to (output, mask). The mask marks
+    # the real tokens when the embedding has mask_zero set
+    ##################################################
+    def embedding (self, X, mask, config, weights):
+        if config.get('mask_zero', False):
+            mask = X != 0
+        if weights[0].dtype == np.int8:
+            # int8 table with one scale per row (see quantize_model.py)
+            return weights[0][X].astype(np.float32) * weights[1][X][..., np.newaxis], mask
+        return weights[0][X].astype(np.float32, copy=False), mask
+
+    def identity (self, h, mask, config, weights):
+        return h, mask
+
+    def lstm (self, h, mask, config, weights):
+        return self.run_lstm(h, mask, config, weights), mask
+
+    def bidirectional (self, h, mask, config, weights):
+        layer_config = config['layer']['config']
+        num_weights = len(weights) // 2
+
+        forward = self.run_lstm(h, mask, layer_config, weights[:num_weights])
+        # the backward layer reads the reversed sentence, its outputs are put back in the input order
+        backward_mask = None if mask is None else mask[:, ::-1]
+        backward = self.run_lstm(h[:, ::-1], backward_mask, layer_config, weights[num_weights:])[:, ::-1]
+
+        merge_mode = config.get('merge_mode', 'concat')
+        if merge_mode == 'concat':
+            return np.concatenate([forward, backward], axis=-1), mask
+        elif merge_mode == 'sum':
+            return forward + backward, mask
+        elif merge_mode == 'mul':
+            return forward * backward, mask
+        elif merge_mode == 'ave':
+            return (forward + backward) / 2, mask
+        raise ValueError("Unsupported merge mode {}".format(merge_mode))
+
+    def conv1d (self, h, mask, config, weights):
+        kernel = weights[0]
+        kernel_size = kernel.shape[0]
+        dilation_rate = config.get('dilation_rate', 1)
+        dilation_rate = dilation_rate[0] if isinstance(dilation_rate, (list, tuple)) else dilation_rate
+        strides = config.get('strides', 1)
+        if (strides[0] if isinstance(strides, (list, tuple)) else strides) != 1:
+            raise ValueError("Unsupported Conv1D strides {}".format(strides))
+
+        # zero padding of the time axis as done by the tensorflow backend
+        num_padded = dilation_rate * (kernel_size - 1)
+        padding = config.get('padding', 'valid')
+        if padding == 'same':
+            h = np.pad(h, ((0, 0), (num_padded // 2, num_padded - num_padded // 2), (0, 0)), mode='constant')
+        elif padding == 'causal':
+            h = np.pad(h, ((0, 0), (num_padded, 0), (0, 0)), mode='constant')
+        elif padding != 'valid':
+            raise ValueError("Unsupported Conv1D padding {}".format(padding))
+
+        # one matrix product per kernel position, over all the time steps at once
+        num_steps = h.shape[1] - num_padded
+        out = np.dot(h[:, :num_steps], kernel[0])
+        for k in range(1, kernel_size):
+            start = k * dilation_rate
+            out += np.dot(h[:, start:start + num_steps], kernel[k])
+        if config.get('use_bias', True):
+            out += weights[1]
+        return self.activation(config.get('activation', 'linear'), out), mask
+
+    def time_distributed (self, h, mask, config, weights):
+        layer = config['layer']
+        if layer['class_name'] != 'Dense':
+            raise ValueError("Unsupported TimeDistributed layer {}".format(layer['class_name']))
+        return self.dense(h, mask, layer['config'], weights)
+
+    def dense (self, h, mask, config, weights):
+        h = np.dot(h, weights[0])
+        if config.get('use_bias', True):
+            h += weights[1]
+        return self.activation(config.get('activation', 'linear'), h), mask
+
+    LAYER_TYPES = {
+        'Embedding': embedding,
+        'InputLayer': identity,
+        'Dropout': identity,
+        'LSTM': lstm,
+        'Bidirectional': bidirectional,
+        'Conv1D': conv1d,
+        'TimeDistributed': time_distributed,
+        'Dense': dense,
+    }
+
+    ##################################################
+    # run_lstm
+    # keras LSTM over a whole batch: the input projection is computed
+    # for all the time steps at once, only the recurrent part loops.
+    # The gates are in the keras order input, forget, cell, output
+    ##################################################
+    def run_lstm (self, h, mask, config, weights):
+        kernel, recurrent_kernel = weights[0], weights[1]
+        units = recurrent_kernel.shape[0]
+        activation = config.get('activation', 'tanh')
+        recurrent_activation = config.get('recurrent_activation', 'hard_sigmoid')
+
+        if config.get('go_backwards', False):
+            h = h[:, ::-1]
+            mask = None if mask is None else mask[:, ::-1]
+
+        batch_size, num_steps = h.shape[0], h.shape[1]
+        state_h = np.zeros((batch_size, units), dtype=np.float32)
+        state_c = np.zeros((batch_size, units), dtype=np.float32)
+        outputs = np.zeros((batch_size, num_steps, units), dtype=np.float32)
+
+        # with a mask, the steps where the whole batch is padding are not computed:
+        # the state stays zero before the first real token and unchanged after the last one
+        first_step, end_step = 0, num_steps
+        if mask is not None:
+            active_steps = np.flatnonzero(mask.any(axis=0))
+            if len(active_steps) == 0:
+                return outputs if config.get('return_sequences', False) else outputs[:, -1]
+            first_step, end_step = active_steps[0], active_steps[-1] + 1
+
+        x_proj = np.dot(h[:, first_step:end_step], kernel)
+        if config.get('use_bias', True):
+            x_proj += weights[2]
+
+        for step in range(first_step, end_step):
+            z = x_proj[:, step - first_step] + np.dot(state_h, recurrent_kernel)
+            i = self.activation(recurrent_activation, z[:, :units])
+            f = self.activation(recurrent_activation, z[:, units: 2 * units])
+            c = f * state_c + i * self.activation(activation, z[:, 2 * units: 3 * units])
+            o = self.activation(recurrent_activation, z[:, 3 * units:])
+            new_h = o * self.activation(activation, c)
+
+            if mask is None:
+                state_h, state_c = new_h, c
+            else:
+                # masked steps keep the previous state and repeat the previous output (keras 2.0/2.1;
+                # later versions output zeros there, the padding positions are dropped when decoding anyway)
+                step_mask = mask[:, step][:, np.newaxis]
+                state_h = np.where(step_mask, new_h, state_h)
+                state_c = np.where(step_mask, c, state_c)
+            outputs[:, step] = state_h
+        outputs[:, end_step:] = state_h[:, np.newaxis]
+
+        if not config.get('return_sequences', False):
+            outputs = outputs[:, -1]
+        # like keras, a go_backwards layer returns its outputs in the reversed order
+        return outputs
+
+    ##################################################
+    # activation
+    # the activations as defined by the keras tensorflow backend
+    ##################################################
+    def activation (self, name, x):
+        if name == 'tanh':
+            return np.tanh(x)
+        elif name == 'hard_sigmoid':
+            return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+        elif name == 'sigmoid':
+            return 1.0 / (1.0 + np.exp(-x))
+        elif name == 'relu':
+            return np.maximum(x, 0.0)
+        elif name == 'linear':
+            return x
+        elif name == 'softmax':
+            e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+            return e / np.sum(e, axis=-1, keepdims=True)
+        raise ValueError("Unsupported activation {}".format(name))
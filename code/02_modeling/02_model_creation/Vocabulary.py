@@ -0,0 +1,120 @@
+import numpy as np
+
+class Vocabulary:
+    '''
+    Word to lookup table index map backed by two numpy arrays: the sorted
+    UTF-8 encoded words and their indices. Both arrays can be saved as .npy
+    files and memory-mapped, so loading a multi-million word vocabulary is
+    near-instant and its pages are shared between processes.
+
+    It behaves like the word_to_ix_map dictionary (in, [], get, len).
+    Words added after loading are kept in a small dictionary.
+    '''
+
+    def __init__ (self, words, indices):
+        self.words = words
+        self.indices = indices
+        self.extra_words = {}
+
+    ##################################################
+    # from_dict
+    ##################################################
+    @classmethod
+    def from_dict (cls, word_to_ix_map):
+        words = np.array([word.encode('utf-8') for word in word_to_ix_map.keys()])
+        indices = np.fromiter(word_to_ix_map.values(), dtype=np.int32, count=len(word_to_ix_map))
+
+        order = np.argsort(words, kind='mergesort')
+        return cls(words[order], indices[order])
+
+    ##################################################
+    # load
+    ##################################################
+    @classmethod
+    def load (cls, words_file, indices_file, mmap_mode = 'r'):
+        return cls(np.load(words_file, mmap_mode=mmap_mode), np.load(indices_file, mmap_mode=mmap_mode))
+
+    ##################################################
+    # save
+    ##################################################
+    def save (self, words_file, indices_file):
+        words, indices = self.words, self.indices
+        if len(self.extra_words) > 0:
+            merged = self.to_dict()
+            merged_vocab = Vocabulary.from_dict(merged)
+            words, indices = merged_vocab.words, merged_vocab.indices
+
+        np.save(words_file, words)
+        np.save(indices_file, indices)
+
+    ##################################################
+    # to_dict
+    ##################################################
+    def to_dict (self):
+        word_to_ix_map = {word.decode('utf-8'): int(index) for word, index in zip(self.words, self.indices)}
+        word_to_ix_map.update(self.extra_words)
+        return word_to_ix_map
+
+    ##################################################
+    # find
+    # index of the word in the lookup table, -1 if it is not in the vocabulary
+    ##################################################
+    def find (self, word):
+        if word in self.extra_words:
+            return self.extra_words[word]
+
+        key = word.encode('utf-8')
+        # longer words would be truncated to the width of the array and match the wrong entry
+        if len(self.words) == 0 or len(key) > self.words.dtype.itemsize:
+            return -1
+
+        pos = np.searchsorted(self.words, key)
+        if pos < len(self.words) and self.words[pos] == key:
+            return int(self.indices[pos])
+        return -1
+
+    ##################################################
+    # lookup
+    # indices of a whole list of words, -1 for the words that are not in
+    # the vocabulary. The words are looked up by vectorized chunks, so the
+    # fixed-width copies of the words stay small
+    ##################################################
+    def lookup (self, words, chunk_size = 65536):
+        word_ids = np.full(len(words), -1, dtype=np.int32)
+
+        if len(self.words) > 0:
+            for start in range(0, len(words), chunk_size):
+                keys = np.char.encode(np.asarray(words[start:start + chunk_size], dtype=np.str_), 'utf-8')
+                # cast the keys to the width of the vocabulary so the vocabulary is never copied,
+                # the words that are longer than that width can't be in the vocabulary
+                fits = np.char.str_len(keys) <= self.words.dtype.itemsize
+                keys = keys.astype(self.words.dtype)
+
+                pos = np.minimum(np.searchsorted(self.words, keys), len(self.words) - 1)
+                found = fits & (self.words[pos] == keys)
+                word_ids[start:start + chunk_size][found] = self.indices[pos[found]]
+
+        if len(self.extra_words) > 0:
+            for ind in np.flatnonzero(word_ids < 0):
+                word_ids[ind] = self.extra_words.get(str(words[ind]), -1)
+
+        return word_ids
+
+    def get (self, word, default = None):
+        index = self.find(word)
+        return default if index < 0 else index
+
+    def __contains__ (self, word):
+        return self.find(word) >= 0
+
+    def __getitem__ (self, word):
+        index = self.find(word)
+        if index < 0:
+            raise KeyError(word)
+        return index
+
+    def __setitem__ (self, word, index):
+        self.extra_words[word] = index
+
+    def __len__ (self):
+        return len(self.words) + len(self.extra_words)
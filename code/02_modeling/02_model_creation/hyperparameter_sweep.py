@@ -0,0 +1,249 @@
+# coding: utf-8
+'''
+Hyperparameter sweep of EntityExtractor.train on a multi-core CPU machine.
+
+The training and test sets are vectorized once by the main process: the
+lookup table and the vocabulary are saved as memory-mapped .npy resources
+and the padded id and label arrays go to the dataset cache of DataReader.
+The trials then run concurrently in num_workers processes, each one in a
+fresh process that memory-maps the shared arrays instead of parsing the
+files, with its TensorFlow session and its BLAS libraries limited to
+threads_per_trial threads so that the trials don't compete for the cores.
+
+The search space is a JSON object mapping the parameters of train to the
+list of their values, e.g.
+{"network_type": ["unidirectional", "bidirectional"], "num_layers": [1, 2], "dropout": [0.2, 0.5]}
+--search grid runs every combination, --search random samples --num_trials
+of them. With random search a parameter can also be given as a range,
+{"dropout": {"uniform": [0.1, 0.5]}}.
+
+Each trial writes its model, its predictions and its training log under
+<output_dir>/trial_<k>. The precision, recall and F1 score of the entity
+tags (from evaluate_model), the training time and the training and tagging
+throughputs of all the trials are gathered in <output_dir>/results.tsv.
+
+Run it from the root folder of the project:
+
+python code\\02_modeling\\02_model_creation\\hyperparameter_sweep.py --train_file sample_data\\drugs_and_diseases\\Drug_and_Disease_train.txt
+    --test_file sample_data\\drugs_and_diseases\\Drug_and_Disease_test.txt
+    --embeddings C:\\dl4nlp\\models\\w2vmodel_pubmed_vs_50_ws_5_mc_400.pkl
+    --output_dir C:\\dl4nlp\\sweep --num_workers 4 --threads_per_trial 4
+
+'''
+import os
+import json
+import argparse
+import itertools
+import contextlib
+import multiprocessing
+import timeit as t
+import numpy as np
+import pandas as pd
+
+from DataReader import DataReader
+from EntityExtractor import EntityExtractor
+
+# the parameters of EntityExtractor.train that can be searched
+TRAIN_PARAMETERS = ["network_type", "num_layers", "num_hidden_units", "num_epochs", "batch_size", \
+                    "dropout", "reg_alpha", "bucketing", "masking", "kernel_size", \
+                    "validation_split", "early_stopping_patience"]
+
+DEFAULT_SPACE = {
+    "network_type": ["unidirectional", "bidirectional"],
+    "num_layers": [1, 2],
+    "num_hidden_units": [150],
+    "num_epochs": [10],
+    "batch_size": [50],
+    "dropout": [0.2],
+}
+
+# environment variables read by the BLAS and OpenMP libraries when they are loaded
+THREAD_LIMIT_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+#########################################################
+#   read_search_space
+#   the search space from a JSON string or a JSON file
+#########################################################
+def read_search_space(space):
+    if space is None:
+        return DEFAULT_SPACE
+    if os.path.isfile(space):
+        with open(space, 'r') as f:
+            space = f.read()
+    space = json.loads(space)
+
+    unknown = [name for name in space if name not in TRAIN_PARAMETERS]
+    if len(unknown) > 0:
+        raise ValueError("Unknown parameters {}, expected some of {}".format(unknown, TRAIN_PARAMETERS))
+    return space
+
+#########################################################
+#   create_trials
+#   the parameters of each trial: every combination of the values
+#   (grid), or num_trials combinations sampled without repetition (random)
+#########################################################
+def create_trials(space, search = 'grid', num_trials = 10, seed = 42):
+    names = sorted(space)
+    if search == 'grid':
+        for values in space.values():
+            if not isinstance(values, list):
+                raise ValueError("grid search needs a list of values for each parameter")
+        return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+    rng = np.random.RandomState(seed)
+    choice_names = [name for name in names if isinstance(space[name], list)]
+    combinations = list(itertools.product(*[space[name] for name in choice_names]))
+    sampled = rng.permutation(len(combinations))[:num_trials] if len(combinations) >= num_trials \
+              else rng.randint(len(combinations), size = num_trials)
+
+    trials = []
+    for combination_ind in sampled:
+        params = dict(zip(choice_names, combinations[combination_ind]))
+        for name in names:
+            if name in params:
+                continue
+            if "uniform" in space[name]:
+                low, high = space[name]["uniform"]
+                params[name] = float(rng.uniform(low, high))
+            else:
+                raise ValueError("{}: expected a list of values or {{\"uniform\": [low, high]}}".format(name))
+        trials.append(params)
+    return trials
+
+#########################################################
+#   prepare_dataset
+#   vectorize the training and test sets once, into the resources
+#   file and the dataset cache shared by all the trials
+#########################################################
+def prepare_dataset(train_file, test_file, embeddings_file, resources_file, dataset_cache_dir, \
+                    num_oov_buckets = 0, max_sentence_len = None):
+    reader = DataReader(mmap_resources = True, max_sentence_len = max_sentence_len, dataset_cache_dir = dataset_cache_dir)
+    reader.load_embedding_lookup_table(embeddings_file, num_oov_buckets)
+    train_X, train_Y = reader.read_and_parse_training_data(train_file, resources_file)
+
+    # the test set is vectorized with the tags and the padded length saved in the resources
+    test_reader = DataReader(input_resources_pickle_file = resources_file, dataset_cache_dir = dataset_cache_dir)
+    test_X, test_Y, data_set, num_tokens_list = test_reader.read_and_parse_test_data(test_file)
+    print("training set: {}, test set: {}".format(train_X.shape, test_X.shape))
+
+#########################################################
+#   run_trial
+#   train, save and evaluate one model in its own TensorFlow session
+#   limited to threads_per_trial threads. The output goes to train.log
+#########################################################
+def run_trial(args):
+    trial_ind, params, settings = args
+    trial_dir = os.path.join(settings["output_dir"], "trial_{}".format(trial_ind))
+    if not os.path.exists(trial_dir):
+        os.makedirs(trial_dir)
+
+    result = {"trial": trial_ind}
+    result.update(params)
+    with open(os.path.join(trial_dir, "train.log"), 'w') as f_log, contextlib.redirect_stdout(f_log):
+        try:
+            result.update(train_and_evaluate(params, settings, trial_dir))
+        except Exception as e:
+            print("trial {} failed: {}".format(trial_ind, repr(e)))
+            result["error"] = repr(e)
+    return result
+
+def train_and_evaluate(params, settings, trial_dir):
+    import tensorflow as tf
+    import keras.backend as K
+
+    threads = settings["threads_per_trial"]
+    config = tf.ConfigProto(intra_op_parallelism_threads = threads, inter_op_parallelism_threads = threads)
+    session = tf.Session(graph = tf.Graph(), config = config)
+    with session.graph.as_default(), session.as_default():
+        K.set_session(session)
+
+        # the resources and the vectorized data sets are memory-mapped, not parsed again
+        reader = DataReader(input_resources_pickle_file = settings["resources_file"], \
+                            max_sentence_len = settings["max_sentence_len"], dataset_cache_dir = settings["dataset_cache_dir"])
+        entityExtractor = EntityExtractor(reader)
+
+        start = t.default_timer()
+        entityExtractor.train(settings["train_file"], output_resources_pickle_file = None, **params)
+        train_time = t.default_timer() - start
+        num_train_sentences = reader.n_sentences_all
+
+        model_file = os.path.join(trial_dir, "model.h5")
+        entityExtractor.save(model_file)
+
+        test_X, test_Y, data_set, num_tokens_list = reader.read_and_parse_test_data(settings["test_file"])
+        start = t.default_timer()
+        entityExtractor.predict_tags(test_X, num_tokens_list, batch_size = settings["tag_batch_size"])
+        tag_time = t.default_timer() - start
+
+        evaluation_report, conf_matrix_df = entityExtractor.evaluate_model(settings["test_file"], \
+            os.path.join(trial_dir, "prediction_output.tsv"), batch_size = settings["tag_batch_size"])
+        print(evaluation_report)
+        precision, recall, f1 = entityExtractor.get_entity_scores(conf_matrix_df)
+
+    session.close()
+    K.clear_session()
+
+    num_epochs = params.get("num_epochs", 1)
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "F1": round(f1, 4), \
+            "train time (s)": round(train_time, 1), \
+            "train sentences/s": round(num_train_sentences * num_epochs / train_time, 1), \
+            "tagging sentences/s": round(len(test_X) / tag_time, 1), \
+            "model": model_file}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Hyperparameter sweep of the entity extraction model")
+    parser.add_argument("--train_file", required = True, help = "IOB training file")
+    parser.add_argument("--test_file", required = True, help = "IOB test file")
+    parser.add_argument("--embeddings", required = True, help = "word2vec embeddings .pkl file")
+    parser.add_argument("--output_dir", required = True, help = "folder of the shared resources, the trials and results.tsv")
+    parser.add_argument("--space", help = "search space as a JSON string or file (default: {})".format(json.dumps(DEFAULT_SPACE)))
+    parser.add_argument("--search", default = "grid", choices = ["grid", "random"])
+    parser.add_argument("--num_trials", type = int, default = 10, help = "number of trials of the random search")
+    parser.add_argument("--seed", type = int, default = 42)
+    parser.add_argument("--num_workers", type = int, default = 2, help = "number of trials run at the same time")
+    parser.add_argument("--threads_per_trial", type = int, \
+                        default = max(1, multiprocessing.cpu_count() // 2), help = "threads of each trial")
+    parser.add_argument("--tag_batch_size", type = int, default = 500)
+    parser.add_argument("--num_oov_buckets", type = int, default = 0)
+    parser.add_argument("--max_sentence_len", type = int, default = None)
+    args = parser.parse_args()
+
+    trials = create_trials(read_search_space(args.space), args.search, args.num_trials, args.seed)
+    print("{} trials, {} at a time with {} threads each".format(len(trials), args.num_workers, args.threads_per_trial))
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    resources_file = os.path.join(args.output_dir, "resources.pkl")
+    dataset_cache_dir = os.path.join(args.output_dir, "dataset_cache")
+    prepare_dataset(args.train_file, args.test_file, args.embeddings, resources_file, dataset_cache_dir, \
+                    args.num_oov_buckets, args.max_sentence_len)
+
+    settings = {"output_dir": args.output_dir, "resources_file": resources_file, "dataset_cache_dir": dataset_cache_dir, \
+                "train_file": args.train_file, "test_file": args.test_file, \
+                "max_sentence_len": args.max_sentence_len, "threads_per_trial": args.threads_per_trial, \
+                "tag_batch_size": args.tag_batch_size}
+
+    # the worker processes are started fresh (not forked from this process, which has already loaded numpy)
+    # so that the BLAS libraries they load read the thread limits, and each trial gets its own process
+    for name in THREAD_LIMIT_VARIABLES:
+        os.environ[name] = str(args.threads_per_trial)
+    context = multiprocessing.get_context("spawn")
+
+    start = t.default_timer()
+    results = []
+    with context.Pool(args.num_workers, maxtasksperchild = 1) as pool:
+        for result in pool.imap_unordered(run_trial, [(trial_ind, params, settings) for trial_ind, params in enumerate(trials)]):
+            results.append(result)
+            print("trial {} done ({}/{}) after {} s: {}".format(result["trial"], len(results), len(trials), \
+                  round(t.default_timer() - start, 1), result.get("error", "F1 = {}".format(result.get("F1")))))
+
+    results_df = pd.DataFrame(results).set_index("trial").sort_index()
+    if "F1" in results_df:
+        results_df = results_df.sort_values("F1", ascending = False)
+    results_df.to_csv(os.path.join(args.output_dir, "results.tsv"), sep = '\t')
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(results_df)
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
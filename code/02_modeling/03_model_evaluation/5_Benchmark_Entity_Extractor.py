@@ -0,0 +1,290 @@
+# coding: utf-8
+'''
+Throughput benchmarks for the entity extraction model.
+
+This script expects the model and the resources file produced by
+3_Train_Neural_Entity_Extractor_GPU.py under ~/dl4nlp/models (C:\\dl4nlp\\models on Windows).
+Run it from the root folder of the project so that the sample_data folder can be found.
+The paths that must give the same output are checked: when they differ, an
+AssertionError stops the script with an error.
+
+python code/02_modeling/03_model_evaluation/5_Benchmark_Entity_Extractor.py
+
+'''
+import os
+import sys
+import timeit as t
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "02_model_creation"))
+
+import keras.backend as K
+from DataReader import DataReader, tokenize_text
+from EntityExtractor import EntityExtractor
+from NumpyModel import NumpyModel
+
+#########################################################
+#   read_test_sentences
+#   the word sequences of the labeled test file, used as unlabeled input
+#########################################################
+def read_test_sentences(reader, test_file_path):
+    _, _, data_set, _ = reader.read_and_parse_test_data(test_file_path)
+    return [word_seq for word_seq, tag_seq in data_set]
+
+#########################################################
+#   predict_per_sentence
+#   the tags of the original predict loop, one model.predict call per sentence
+#########################################################
+def predict_per_sentence(entityExtractor, feat_vector_list, num_tokens_list):
+    predicted_tags = []
+    for feat_vector, num_tokens in zip(feat_vector_list, num_tokens_list):
+        prob_dist = entityExtractor.model_predict(np.array([feat_vector]), batch_size = 1)[0]
+        pred_tags = entityExtractor.reader.decode_prediction_sequence(prob_dist)
+        predicted_tags.append(pred_tags[len(pred_tags) - num_tokens:])
+    return predicted_tags
+
+#########################################################
+#   benchmark_batched_inference
+#   compare one model.predict call per sentence with the batched path:
+#   all the batch sizes must give the same tags as the per sentence loop
+#########################################################
+def benchmark_batched_inference(entityExtractor, all_sentences_words, batch_sizes = [1, 50, 500]):
+    feat_vector_list, word_seq_list, num_tokens_list = entityExtractor.reader.create_feature_vectors(all_sentences_words)
+    n_sentences = len(feat_vector_list)
+
+    start = t.default_timer()
+    reference_tags = predict_per_sentence(entityExtractor, feat_vector_list, num_tokens_list)
+    reference_time = t.default_timer() - start
+    print("per sentence: {} sentences in {} s ({} sentences/s)".format(n_sentences, \
+        round(reference_time, 2), round(n_sentences / reference_time, 1)))
+
+    for batch_size in batch_sizes:
+        start = t.default_timer()
+        predicted_tags = entityExtractor.predict_tags(feat_vector_list, num_tokens_list, batch_size = batch_size)
+        end = t.default_timer()
+
+        num_different = sum(tags != reference for tags, reference in zip(predicted_tags, reference_tags))
+        print("batch_size = {}: {} sentences in {} s ({} sentences/s, speedup x{}), same output as per sentence: {}".format( \
+            batch_size, n_sentences, round(end - start, 2), round(n_sentences / (end - start), 1), \
+            round(reference_time / (end - start), 1), num_different == 0))
+        if num_different > 0:
+            raise AssertionError("{} sentences are tagged differently with batch_size = {} and one sentence at a time".format( \
+                num_different, batch_size))
+
+#########################################################
+#   benchmark_length_bucketing
+#   compare padding every sentence to max_sentence_len_train with length buckets.
+#   The model has to be trained with bucketing = True (variable input length).
+#   The tags must be the same when the padding can't change them: with a
+#   masked model, or with a fixed input length (bucketing is then turned off)
+#########################################################
+def benchmark_length_bucketing(entityExtractor, all_sentences_words, batch_size = 500):
+    feat_vector_list, word_seq_list, num_tokens_list = entityExtractor.reader.create_feature_vectors(all_sentences_words)
+    n_sentences = len(feat_vector_list)
+
+    results = {}
+    for bucketing in [False, True]:
+        start = t.default_timer()
+        predicted_tags = entityExtractor.predict_tags(feat_vector_list, num_tokens_list, \
+            batch_size = batch_size, bucketing = bucketing)
+        end = t.default_timer()
+
+        results[bucketing] = predicted_tags
+        print("bucketing = {}: {} sentences in {} s ({} sentences/s)".format(bucketing, n_sentences, \
+            round(end - start, 2), round(n_sentences / (end - start), 1)))
+
+    padded_tokens = n_sentences * feat_vector_list.shape[1]
+    print("real tokens = {}, padded tokens = {}".format(sum(num_tokens_list), padded_tokens))
+    num_different = sum(tags != reference for tags, reference in zip(results[True], results[False]))
+    print("same tags with and without bucketing: {} ({} different sentences)".format(num_different == 0, num_different))
+
+    first_layer = entityExtractor.model.layers[0]
+    # the layers of a NumpyModel are (class name, config, weights) tuples
+    masked = first_layer[1].get('mask_zero', False) if isinstance(first_layer, tuple) else getattr(first_layer, 'mask_zero', False)
+    if num_different > 0 and (masked or entityExtractor.model.input_shape[1] is not None):
+        raise AssertionError("{} sentences are tagged differently with bucketing".format(num_different))
+
+#########################################################
+#   benchmark_numpy_engine
+#   check that the numpy inference engine predicts the same probabilities
+#   as keras.Model.predict (within atol, the float32 sums are not done in
+#   the same order) and the same tags, and compare the loading and tagging times
+#########################################################
+def benchmark_numpy_engine(entityExtractor, model_file_path, all_sentences_words, batch_size = 500, atol = 1e-5):
+    from keras.models import load_model
+
+    start = t.default_timer()
+    keras_model = load_model(model_file_path)
+    end = t.default_timer()
+    print("keras load time: {} s".format(round(end - start, 2)))
+
+    start = t.default_timer()
+    numpy_model = NumpyModel.load(model_file_path)
+    end = t.default_timer()
+    print("numpy load time: {} s".format(round(end - start, 2)))
+
+    feat_vector_list, word_seq_list, num_tokens_list = entityExtractor.reader.create_feature_vectors(all_sentences_words)
+    n_sentences = len(feat_vector_list)
+
+    results = {}
+    for engine, model in [("keras", keras_model), ("numpy", numpy_model)]:
+        start = t.default_timer()
+        results[engine] = model.predict(feat_vector_list, batch_size = batch_size)
+        end = t.default_timer()
+        print("{}: {} sentences in {} s ({} sentences/s)".format(engine, n_sentences, \
+            round(end - start, 2), round(n_sentences / (end - start), 1)))
+
+    # only the real tokens are compared, the padding positions are dropped when decoding
+    _, seq_len = feat_vector_list.shape
+    real_tokens = np.arange(seq_len)[np.newaxis, :] >= seq_len - np.array(num_tokens_list)[:, np.newaxis]
+    max_diff = np.abs(results["keras"] - results["numpy"])[real_tokens].max()
+    same_tags = np.array_equal(results["keras"].argmax(axis=-1)[real_tokens], results["numpy"].argmax(axis=-1)[real_tokens])
+    print("max probability difference = {}, same tags: {}".format(max_diff, same_tags))
+    np.testing.assert_allclose(results["numpy"][real_tokens], results["keras"][real_tokens], rtol = 0, atol = atol, \
+                               err_msg = "the numpy engine and keras predict different probabilities")
+    np.testing.assert_array_equal(results["numpy"].argmax(axis=-1)[real_tokens], results["keras"].argmax(axis=-1)[real_tokens], \
+                                  err_msg = "the numpy engine and keras predict different tags")
+
+#########################################################
+#   benchmark_tokenizers
+#   agreement of FastTokenizer with nltk.word_tokenize and tokens per second of both.
+#   Both run as DataReader does, on the sentences split by sent_tokenize, and every
+#   sentence must get the same tokens. The sample corpora are already tokenized, so their sentences are first turned
+#   back into plain text with the Treebank detokenizer
+#########################################################
+def benchmark_tokenizers(reader, data_files):
+    try:
+        from nltk.tokenize.treebank import TreebankWordDetokenizer
+        detokenize = TreebankWordDetokenizer().detokenize
+    except ImportError:
+        detokenize = lambda words: " ".join(words)
+
+    texts = []
+    for data_file in data_files:
+        texts.extend(detokenize(list(word_seq)) for word_seq, tag_seq in reader.iterate_iob_sentences(data_file))
+    print("number of sentences = {}".format(len(texts)))
+
+    # nltk.word_tokenize runs the Punkt sentence tokenizer again, FastTokenizer expects a single sentence
+    tokenizers = [("nltk.word_tokenize", 'nltk'), ("FastTokenizer", 'fast')]
+
+    results = {}
+    for name, tokenizer in tokenizers:
+        start = t.default_timer()
+        results[name] = [[token for sentence in tokenize_text(text, tokenizer) for token in sentence] for text in texts]
+        end = t.default_timer()
+
+        num_tokens = sum(len(tokens) for tokens in results[name])
+        print("{}: {} tokens in {} s ({} tokens/s)".format(name, num_tokens, round(end - start, 2), round(num_tokens / (end - start))))
+
+    mismatches = [(text, nltk_tokens, fast_tokens) for text, nltk_tokens, fast_tokens in \
+                  zip(texts, results["nltk.word_tokenize"], results["FastTokenizer"]) if nltk_tokens != fast_tokens]
+    print("agreement = {}% ({} different sentences)".format(round(100.0 * (len(texts) - len(mismatches)) / len(texts), 3), len(mismatches)))
+    for text, nltk_tokens, fast_tokens in mismatches[:10]:
+        print(text)
+        print("\tnltk: {}".format(nltk_tokens))
+        print("\tfast: {}".format(fast_tokens))
+    if len(mismatches) > 0:
+        raise AssertionError("FastTokenizer and nltk.word_tokenize tokenize {} sentences differently".format(len(mismatches)))
+
+#########################################################
+#   benchmark_network_types
+#   tagging speed versus F1 score of models of different network types
+#   trained on the same data (e.g. bidirectional and dilated_cnn), run
+#   with the numpy inference engine as in the scoring service
+#########################################################
+def benchmark_network_types(resources_pickle_file, model_files, test_file_path, batch_size = 500, bucketing = False):
+    reader = DataReader(input_resources_pickle_file = resources_pickle_file)
+    test_X, test_Y, data_set, num_tokens_list = reader.read_and_parse_test_data(test_file_path)
+
+    print("model\ttagging (s)\tsentences/s\tprecision\trecall\tF1")
+    for network_type, model_file in model_files:
+        if not os.path.exists(model_file):
+            print("{}: no model file {}".format(network_type, model_file))
+            continue
+
+        entityExtractor = EntityExtractor(reader)
+        entityExtractor.load(model_file, engine = 'numpy')
+
+        start = t.default_timer()
+        entityExtractor.predict_tags(test_X, num_tokens_list, batch_size = batch_size, bucketing = bucketing)
+        end = t.default_timer()
+
+        evaluation_report, conf_matrix_df = entityExtractor.evaluate_model(test_file_path, os.devnull, \
+                                                                           batch_size = batch_size, bucketing = bucketing)
+        precision, recall, f1 = entityExtractor.get_entity_scores(conf_matrix_df)
+        print("{}\t{}\t{}\t{}\t{}\t{}".format(network_type, round(end - start, 2), round(len(test_X) / (end - start), 1), \
+              round(precision, 4), round(recall, 4), round(f1, 4)))
+
+###################################################################################
+#  Run the benchmarks on the drugs and diseases sample data
+###################################################################################
+def main():
+    from sys import platform
+    if platform == "win32":
+        home_dir = "C:\\dl4nlp"
+    else:
+        home_dir = os.path.join(os.path.expanduser('~'), "dl4nlp")
+
+    print("home_dir = {}".format(home_dir))
+
+    # The hyper-parameters of the word embedding trained model
+    window_size = 5
+    embed_vector_size = 50
+    min_count =400
+
+    data_folder = os.path.join("sample_data","drugs_and_diseases")
+    test_file_path = os.path.join(data_folder, "Drug_and_Disease_test.txt")
+    sample_data_files = [os.path.join("sample_data", "bc2", "BC2_train.txt"), \
+                         os.path.join("sample_data", "bc5", "BC5_train.txt"), \
+                         os.path.join("sample_data", "drugs", "Drugs_train.txt"), \
+                         os.path.join(data_folder, "Drug_and_Disease_train.txt")]
+    resources_pickle_file = os.path.join(home_dir, "models", "resources.pkl")
+
+    # The hyper-parameters of the LSTM trained model
+    network_type= 'bidirectional'
+    num_layers = 2
+    num_hidden_units = 150
+    num_epochs = 10
+
+    model_file_path = os.path.join(home_dir,'models','lstm_{}_model_units_{}_lyrs_{}_epchs_{}_vs_{}_ws_{}_mc_{}.h5'.\
+                  format(network_type, num_hidden_units, num_layers,  num_epochs, embed_vector_size, window_size, min_count))
+
+    # models of the other network types, trained with 3_Train_Neural_Entity_Extractor_GPU.py on the same data
+    network_type_model_files = [(other_network_type, os.path.join(home_dir,'models','lstm_{}_model_units_{}_lyrs_{}_epchs_{}_vs_{}_ws_{}_mc_{}.h5'.\
+                                format(other_network_type, num_hidden_units, num_layers,  num_epochs, embed_vector_size, window_size, min_count))) \
+                                for other_network_type in ['unidirectional', 'bidirectional', 'dilated_cnn']]
+
+    print("\nTokenizers")
+    benchmark_tokenizers(DataReader(), sample_data_files)
+
+    K.clear_session()
+    with K.get_session() as sess:
+        K.set_session(sess)
+        graphr = K.get_session().graph
+        with graphr.as_default():
+            reader = DataReader(input_resources_pickle_file = resources_pickle_file)
+            entityExtractor = EntityExtractor(reader)
+
+            print("Loading the model from file {} ...".format(model_file_path))
+            entityExtractor.load(model_file_path)
+
+            all_sentences_words = read_test_sentences(reader, test_file_path)
+
+            print("\nBatched inference")
+            benchmark_batched_inference(entityExtractor, all_sentences_words)
+
+            print("\nLength bucketing")
+            benchmark_length_bucketing(entityExtractor, all_sentences_words)
+
+            print("\nNumpy inference engine")
+            benchmark_numpy_engine(entityExtractor, model_file_path, all_sentences_words)
+
+    K.clear_session()
+    K.set_session(None)
+
+    print("\nNetwork types: speed versus F1")
+    benchmark_network_types(resources_pickle_file, network_type_model_files, test_file_path)
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# coding: utf-8
+'''
+Tag the PubMed abstracts parsed by 1_Download_and_Parse_XML_Spark.py with a
+process pool.
+
+The inputs are the tab separated files written by the parsing script (a
+"pmid<TAB>abstract" header line, then one abstract per line), or the Spark
+output folders that contain them. Each file is cut into shards of
+shard_size abstracts and the shards are tagged by num_workers processes.
+Every process loads model.h5 and resources.pkl once, with the numpy
+inference engine by default. The numpy engine memory-maps the embedding
+table of model.h5, the largest weight of the model, so the processes share
+its pages instead of reading one copy each (the keras engine still loads one
+copy per process). The resources are only used to map the words to their
+row, convert them with convert_resources.py so that the processes don't
+unpickle the unused lookup table of the resources either.
+
+Each shard is written to <output_dir>/<input name>.shard<k>.tsv with one
+"pmid<TAB>sentence index<TAB>JSON string" line per sentence. Shards whose
+output file already exists are skipped, so an interrupted run can be
+resumed, and with --merged_output the shards are concatenated in order into
+a single file.
+
+python batch_tag.py --model C:\\dl4nlp\\models\\model.h5 --resources C:\\dl4nlp\\models\\mmap\\resources.pkl
+    --output_dir C:\\dl4nlp\\output\\pubmed_tags --merged_output C:\\dl4nlp\\output\\pubmed_tags.tsv
+    D:\\bio-ner\\tsv\\pubmed_data\\tsv_files
+
+'''
+import os
+import sys
+import csv
+import glob
+import argparse
+import multiprocessing
+import timeit as t
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "02_modeling", "02_model_creation"))
+
+from DataReader import DataReader
+from EntityExtractor import EntityExtractor
+
+OUTPUT_HEADER = "pmid\tsentence\ttags\n"
+
+# the entity extractor of the worker process and its batch size, set by init_worker
+entityExtractor = None
+tag_batch_size = 500
+
+#########################################################
+#   find_input_files
+#   the tab separated files of the inputs, the folders are searched for the
+#   part files written by Spark and for .tsv files
+#########################################################
+def find_input_files(inputs):
+    input_files = []
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            found = [path for pattern in ["part-*", "*.tsv", "*.csv"] \
+                     for path in glob.glob(os.path.join(input_path, "**", pattern), recursive = True)]
+            input_files.extend(sorted(path for path in set(found) if os.path.isfile(path)))
+        else:
+            input_files.append(input_path)
+    return input_files
+
+#########################################################
+#   find_shards
+#   (input file, shard index, byte offset, number of abstracts) of the
+#   shards of an input file. Only the offsets are kept in memory
+#########################################################
+def find_shards(input_file, shard_size):
+    shards = []
+    with open(input_file, 'rb') as f:
+        header = f.readline().decode('utf-8').rstrip('\r\n').split('\t')
+        if 'pmid' not in header or 'abstract' not in header:
+            raise ValueError("{} doesn't start with a pmid<TAB>abstract header line".format(input_file))
+
+        offset, num_lines = f.tell(), 0
+        for line in iter(f.readline, b''):
+            num_lines += 1
+            if num_lines == shard_size:
+                shards.append((input_file, len(shards), offset, num_lines))
+                offset, num_lines = f.tell(), 0
+
+        if num_lines > 0:
+            shards.append((input_file, len(shards), offset, num_lines))
+    return shards
+
+def get_shard_output_file(output_dir, shard):
+    input_file, shard_index, offset, num_lines = shard
+    # the Spark part files of different folders have the same names, keep the folder name
+    input_name = os.path.basename(os.path.dirname(os.path.abspath(input_file))) + "_" + os.path.basename(input_file)
+    return os.path.join(output_dir, "{}.shard{}.tsv".format(input_name, shard_index))
+
+#########################################################
+#   read_shard
+#   the (pmid, abstract) records of a shard. The fields are quoted
+#   and escaped the way the Spark csv writer does it
+#########################################################
+def read_shard(shard):
+    input_file, shard_index, offset, num_lines = shard
+    with open(input_file, 'rb') as f:
+        header = f.readline().decode('utf-8').rstrip('\r\n').split('\t')
+        f.seek(offset)
+        lines = [f.readline().decode('utf-8') for _ in range(num_lines)]
+
+    pmid_col, abstract_col = header.index('pmid'), header.index('abstract')
+    records = []
+    for fields in csv.reader(lines, delimiter = '\t', quotechar = '"', escapechar = '\\', doublequote = False):
+        if len(fields) > max(pmid_col, abstract_col):
+            records.append((fields[pmid_col], fields[abstract_col]))
+    return records
+
+#########################################################
+#   init_worker
+#   load the resources and the model once per process
+#########################################################
+def init_worker(model_file, resources_file, engine, tokenizer, sliding_window, batch_size):
+    global entityExtractor, tag_batch_size
+
+    # the abstracts of a shard are tokenized in the worker process itself
+    reader = DataReader(input_resources_pickle_file = resources_file, num_tokenizer_workers = 1, \
+                        tokenizer = tokenizer, sliding_window = sliding_window)
+    entityExtractor = EntityExtractor(reader)
+    # the processes share the pages of the memory-mapped embedding table
+    entityExtractor.load(model_file, engine = engine, mmap_embedding = True)
+    tag_batch_size = batch_size
+
+#########################################################
+#   tag_shard
+#   tag the abstracts of a shard and write its output file. The file is
+#   written under a temporary name and renamed once it is complete
+#########################################################
+def tag_shard(args):
+    shard, output_file = args
+    start = t.default_timer()
+
+    records = read_shard(shard)
+    abstract_sentences = entityExtractor.reader.tokenize_texts([abstract for pmid, abstract in records])
+    all_sentences_words = [sentence_words for sentences in abstract_sentences for sentence_words in sentences]
+
+    predicted_tags = []
+    if len(all_sentences_words) > 0:
+        feat_vector_list, word_seq_list, num_tokens_list = entityExtractor.reader.create_feature_vectors(all_sentences_words)
+        predicted_tags = entityExtractor.tag_sentences(feat_vector_list, word_seq_list, num_tokens_list, \
+                                                       batch_size = tag_batch_size)
+
+    tmp_output_file = output_file + ".tmp"
+    with open(tmp_output_file, 'w', encoding = 'utf-8') as f_out:
+        f_out.write(OUTPUT_HEADER)
+        sent_ind = 0
+        for (pmid, abstract), sentences in zip(records, abstract_sentences):
+            for abstract_sent_ind in range(len(sentences)):
+                f_out.write("{}\t{}\t{}\n".format(pmid, abstract_sent_ind, predicted_tags[sent_ind]))
+                sent_ind += 1
+    os.replace(tmp_output_file, output_file)
+
+    return (output_file, len(records), len(all_sentences_words), t.default_timer() - start)
+
+#########################################################
+#   merge_shards
+#   concatenate the shard outputs in order, keeping one header line
+#########################################################
+def merge_shards(shard_output_files, merged_output_file):
+    with open(merged_output_file, 'w', encoding = 'utf-8') as f_out:
+        f_out.write(OUTPUT_HEADER)
+        for shard_output_file in shard_output_files:
+            with open(shard_output_file, 'r', encoding = 'utf-8') as f_in:
+                f_in.readline()
+                for line in f_in:
+                    f_out.write(line)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Tag the PubMed abstracts of pmid/abstract TSV files with a process pool")
+    parser.add_argument("inputs", nargs = "+", help = "TSV files or folders of TSV files written by 1_Download_and_Parse_XML_Spark.py")
+    parser.add_argument("--model", required = True, help = "model .h5 file")
+    parser.add_argument("--resources", required = True, help = "resources .pkl file")
+    parser.add_argument("--output_dir", required = True, help = "folder of the shard outputs")
+    parser.add_argument("--merged_output", help = "concatenate the shard outputs into this file")
+    parser.add_argument("--num_workers", type = int, default = multiprocessing.cpu_count())
+    parser.add_argument("--shard_size", type = int, default = 1000, help = "number of abstracts per shard")
+    parser.add_argument("--batch_size", type = int, default = 500)
+    parser.add_argument("--engine", default = "numpy", choices = ["numpy", "keras"])
+    parser.add_argument("--tokenizer", default = "nltk", choices = ["nltk", "fast"])
+    parser.add_argument("--sliding_window", action = "store_true", help = "tag the long sentences in overlapping windows")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    input_files = find_input_files(args.inputs)
+    shards = [shard for input_file in input_files for shard in find_shards(input_file, args.shard_size)]
+    shard_output_files = [get_shard_output_file(args.output_dir, shard) for shard in shards]
+    todo = [(shard, output_file) for shard, output_file in zip(shards, shard_output_files) if not os.path.exists(output_file)]
+    print("{} input files, {} shards, {} already tagged".format(len(input_files), len(shards), len(shards) - len(todo)))
+
+    start = t.default_timer()
+    num_abstracts, num_sentences = 0, 0
+    if len(todo) > 0:
+        num_workers = max(1, min(args.num_workers, len(todo)))
+        print("Tagging {} shards with {} processes".format(len(todo), num_workers))
+        with multiprocessing.Pool(num_workers, initializer = init_worker, \
+                                  initargs = (args.model, args.resources, args.engine, args.tokenizer, \
+                                              args.sliding_window, args.batch_size)) as pool:
+            for output_file, shard_abstracts, shard_sentences, shard_time in pool.imap_unordered(tag_shard, todo):
+                num_abstracts += shard_abstracts
+                num_sentences += shard_sentences
+                elapsed = t.default_timer() - start
+                print("{}: {} abstracts, {} sentences in {} s. Total: {} sentences in {} s ({} sentences/s)".format( \
+                      output_file, shard_abstracts, shard_sentences, round(shard_time, 2), \
+                      num_sentences, round(elapsed, 2), round(num_sentences / elapsed, 1)))
+
+    if args.merged_output:
+        print("Merging {} shards into {}".format(len(shard_output_files), args.merged_output))
+        merge_shards(shard_output_files, args.merged_output)
+
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# coding: utf-8
+'''
+Convert a resources.pkl file written by the model creation phase into the
+memory-mapped resources format. The word embedding lookup table is written to
+<name>_wordvecs.npy (float32) and the vocabulary to <name>_vocab_words.npy and
+<name>_vocab_indices.npy next to the output pickle file, which only keeps the
+model metadata.
+
+python convert_resources.py C:\\dl4nlp\\models\\resources.pkl C:\\dl4nlp\\models\\mmap\\resources.pkl
+
+'''
+import os
+import sys
+import timeit as t
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "02_modeling", "02_model_creation"))
+
+from DataReader import DataReader
+
+def main():
+    if len(sys.argv) != 3:
+        print("usage: python convert_resources.py <input resources.pkl> <output resources.pkl>")
+        sys.exit(1)
+
+    input_resources_pickle_file, output_resources_pickle_file = sys.argv[1], sys.argv[2]
+    if os.path.abspath(input_resources_pickle_file) == os.path.abspath(output_resources_pickle_file):
+        print("The output file must be different from the input file")
+        sys.exit(1)
+
+    output_dir = os.path.dirname(os.path.abspath(output_resources_pickle_file))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    reader = DataReader()
+    reader.convert_resources_pickle_file(input_resources_pickle_file, output_resources_pickle_file)
+
+    # compare the loading time of both formats
+    for resources_pickle_file in [input_resources_pickle_file, output_resources_pickle_file]:
+        start = t.default_timer()
+        DataReader(input_resources_pickle_file = resources_pickle_file)
+        end = t.default_timer()
+        print("Loading time of {}: {} ms".format(resources_pickle_file, round((end - start) * 1000, 2)))
+
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# coding: utf-8
+'''
+Vocabulary pruning of a trained entity extraction model.
+
+Most of model.h5 and resources.pkl is the embedding lookup table, with one
+row for each word of the PubMed word2vec model, and the embedding layer is
+frozen during the training. The pruned model keeps only the rows of the
+words seen in the training files and of the --top_k most frequent PubMed
+words of the vocabulary file written by 2_Train_Word2Vec_Model_Spark.py
+(a "word<TAB>count" file or its Spark output folder), plus the padding,
+UNK and OOV bucket rows. The other words fall back to UNK, the tags of the
+sentences made only of kept words don't change.
+
+The script reports the coverage loss (share of the tokens of --test_file
+that are not in the vocabulary any more), the size of both files and, for
+each model loaded in a fresh process with the numpy inference engine, the
+load time, the resident memory and the F1 score on --test_file.
+
+python prune_vocabulary.py C:\\dl4nlp\\models\\model.h5 C:\\dl4nlp\\models\\resources.pkl
+    C:\\dl4nlp\\models\\model_pruned.h5 C:\\dl4nlp\\models\\resources_pruned.pkl
+    --train_file sample_data\\drugs_and_diseases\\Drug_and_Disease_train.txt
+    --word_counts C:\\dl4nlp\\models\\word2vec_pubmed_vocabulary_mc_400 --top_k 100000
+    --test_file sample_data\\drugs_and_diseases\\Drug_and_Disease_test.txt
+
+'''
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+import timeit as t
+import h5py
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "02_modeling", "02_model_creation"))
+
+from DataReader import DataReader
+from EntityExtractor import EntityExtractor
+
+def decode_attr(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+#########################################################
+#   prune_model
+#   write a copy of the keras .h5 model file whose embedding
+#   table keeps only the given rows, in that order
+#########################################################
+def prune_model(input_model_file, output_model_file, old_rows):
+    # the file is written anew, the space of the datasets deleted from an HDF5 file is not reclaimed
+    with h5py.File(input_model_file, mode='r') as f_in, h5py.File(output_model_file, mode='w') as f_out:
+        for key, value in f_in.attrs.items():
+            f_out.attrs[key] = value
+
+        model_config = json.loads(decode_attr(f_in.attrs['model_config']))
+        layer_configs = model_config['config']
+        if isinstance(layer_configs, dict):
+            layer_configs = layer_configs['layers']
+        embedding_configs = {layer_config['config']['name']: layer_config['config'] \
+                             for layer_config in layer_configs if layer_config['class_name'] == 'Embedding'}
+
+        if 'model_weights' in f_in:
+            weights_in = f_in['model_weights']
+            weights_out = f_out.create_group('model_weights')
+            for key, value in weights_in.attrs.items():
+                weights_out.attrs[key] = value
+            # the optimizer state has no slot for the frozen embedding table
+            for key in f_in:
+                if key != 'model_weights':
+                    f_in.copy(key, f_out)
+        else:
+            weights_in, weights_out = f_in, f_out
+
+        for layer_name in weights_in:
+            if layer_name not in embedding_configs:
+                weights_in.copy(layer_name, weights_out)
+                continue
+
+            config = embedding_configs[layer_name]
+            layer_in = weights_in[layer_name]
+            layer_out = weights_out.create_group(layer_name)
+            for key, value in layer_in.attrs.items():
+                layer_out.attrs[key] = value
+            for weight_name in layer_in.attrs['weight_names']:
+                weight_name = decode_attr(weight_name)
+                weight = layer_in[weight_name][()]
+                # the table, and the row scales of a quantized table (see quantize_model.py)
+                if weight.shape[0] == config['input_dim']:
+                    weight = weight[old_rows]
+                layer_out.create_dataset(weight_name, data=weight)
+
+        for config in embedding_configs.values():
+            config['input_dim'] = len(old_rows)
+        f_out.attrs['model_config'] = json.dumps(model_config).encode('utf-8')
+
+#########################################################
+#   get_resources_size
+#   bytes of the resources pickle file and of its .npy files
+#########################################################
+def get_resources_size(resources_file):
+    resources_dir = os.path.dirname(os.path.abspath(resources_file))
+    base_name = os.path.splitext(os.path.basename(resources_file))[0]
+    npy_files = [os.path.join(resources_dir, base_name + suffix) for suffix in ["_wordvecs.npy", "_vocab_words.npy", "_vocab_indices.npy"]]
+    return os.path.getsize(resources_file) + sum(os.path.getsize(path) for path in npy_files if os.path.exists(path))
+
+#########################################################
+#   get_rss
+#   resident memory of the process in bytes
+#########################################################
+def get_rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    # peak resident memory, in kilobytes on Linux and in bytes on macOS
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+#########################################################
+#   measure_model
+#   load time, memory taken by the loaded model and F1 score on the
+#   test file. It runs in its own process so that the memory of one
+#   model doesn't count for the other
+#########################################################
+def measure_model(args):
+    model_file, resources_file, test_file = args
+    rss_before = get_rss()
+    start = t.default_timer()
+    reader = DataReader(input_resources_pickle_file = resources_file)
+    entityExtractor = EntityExtractor(reader)
+    entityExtractor.load(model_file, engine = 'numpy')
+    load_time = t.default_timer() - start
+    rss = get_rss() - rss_before
+
+    f1 = None
+    if test_file is not None:
+        evaluation_report, conf_matrix_df = entityExtractor.evaluate_model(test_file, os.devnull)
+        f1 = entityExtractor.get_entity_scores(conf_matrix_df)[2]
+    return load_time, rss, f1
+
+def main():
+    parser = argparse.ArgumentParser(description = "Prune the embedding lookup table of the entity extraction model")
+    parser.add_argument("input_model", help = "keras .h5 model file")
+    parser.add_argument("input_resources", help = "resources .pkl file of the model")
+    parser.add_argument("output_model", help = "pruned .h5 model file")
+    parser.add_argument("output_resources", help = "pruned resources .pkl file")
+    parser.add_argument("--train_file", required = True, nargs = "+", help = "IOB training files, all their words are kept")
+    parser.add_argument("--word_counts", help = "word<TAB>count vocabulary file (or Spark output folder) of the PubMed corpus")
+    parser.add_argument("--top_k", type = int, default = 0, help = "number of the most frequent words of --word_counts to keep")
+    parser.add_argument("--test_file", help = "labeled test file, to report the coverage loss and compare the F1 scores")
+    parser.add_argument("--mmap", action = "store_true", help = "save the pruned resources as memory-mapped .npy files")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.input_model) == os.path.abspath(args.output_model) or \
+       os.path.abspath(args.input_resources) == os.path.abspath(args.output_resources):
+        print("The output files must be different from the input files")
+        sys.exit(1)
+
+    reader = DataReader(input_resources_pickle_file = args.input_resources, mmap_resources = args.mmap)
+    if args.test_file:
+        coverage_before = reader.get_vocabulary_coverage(args.test_file)
+    old_rows = reader.prune_vocabulary(args.train_file, args.word_counts, args.top_k)
+    reader.save_resources(args.output_resources)
+    prune_model(args.input_model, args.output_model, old_rows)
+
+    if args.test_file:
+        coverage_after = reader.get_vocabulary_coverage(args.test_file)
+        print("Vocabulary coverage of the test set: {}% -> {}% (loss {}%)".format(round(coverage_before * 100, 2), \
+              round(coverage_after * 100, 2), round((coverage_before - coverage_after) * 100, 2)))
+
+    print("model\tmodel (MB)\tresources (MB)\tload (s)\tmemory (MB)\tF1")
+    context = multiprocessing.get_context("spawn")
+    for model_file, resources_file in [(args.input_model, args.input_resources), (args.output_model, args.output_resources)]:
+        with context.Pool(1) as pool:
+            load_time, rss, f1 = pool.apply(measure_model, ((model_file, resources_file, args.test_file),))
+        print("{}\t{}\t{}\t{}\t{}\t{}".format(os.path.basename(model_file), round(os.path.getsize(model_file) / 2.0 ** 20, 2), \
+              round(get_resources_size(resources_file) / 2.0 ** 20, 2), round(load_time, 3), round(rss / 2.0 ** 20, 1), \
+              "" if f1 is None else round(f1, 4)))
+
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# coding: utf-8
+'''
+Post-training quantization of the entity extraction model for CPU scoring
+with the numpy inference engine (NumpyModel).
+
+The embedding lookup table, which is most of the model, is stored as int8
+with one float32 scale per row (the largest absolute value of the row maps
+to 127) or as float16, and stays in that type in memory: the rows are only
+converted back to float32 when they are looked up. With --float16_weights
+the LSTM and Dense weights are stored as float16 too; they are small, so
+this only makes the file smaller, the engine computes with float32 copies.
+The optimizer state is not copied.
+
+The quantized model can only be loaded with EntityExtractor.load(filepath,
+engine = 'numpy'). Given the resources file and a labeled test file, the
+script evaluates both models with evaluate_model and reports the accuracy
+delta, the size of the weights in memory and the tagging time.
+
+python quantize_model.py C:\\dl4nlp\\models\\model.h5 C:\\dl4nlp\\models\\model_int8.h5
+    --resources C:\\dl4nlp\\models\\resources.pkl --test_file sample_data\\drugs_and_diseases\\Drug_and_Disease_test.txt
+
+'''
+import os
+import sys
+import json
+import argparse
+import timeit as t
+import numpy as np
+import h5py
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "02_modeling", "02_model_creation"))
+
+from DataReader import DataReader
+from EntityExtractor import EntityExtractor
+
+#########################################################
+#   quantize_rows
+#   int8 values and float32 scale of each row of a matrix
+#########################################################
+def quantize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    # the padding row is all zeros
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.round(matrix / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+def decode_attr(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+#########################################################
+#   quantize_model
+#   write a copy of the keras .h5 model file with the quantized weights
+#########################################################
+def quantize_model(input_model_file, output_model_file, embedding = 'int8', float16_weights = False):
+    with h5py.File(input_model_file, mode='r') as f_in, h5py.File(output_model_file, mode='w') as f_out:
+        for key, value in f_in.attrs.items():
+            f_out.attrs[key] = value
+        f_out.attrs['quantization'] = json.dumps({"embedding": embedding, "float16_weights": float16_weights})
+
+        model_config = json.loads(decode_attr(f_in.attrs['model_config']))
+        layer_configs = model_config['config']
+        if isinstance(layer_configs, dict):
+            layer_configs = layer_configs['layers']
+        layer_classes = {layer_config['config']['name']: layer_config['class_name'] for layer_config in layer_configs}
+
+        weights_in = f_in['model_weights'] if 'model_weights' in f_in else f_in
+        weights_out = f_out.create_group('model_weights')
+        for key, value in weights_in.attrs.items():
+            weights_out.attrs[key] = value
+
+        for layer_name in weights_in.attrs['layer_names']:
+            layer_name = decode_attr(layer_name)
+            layer_in = weights_in[layer_name]
+            layer_out = weights_out.create_group(layer_name)
+            for key, value in layer_in.attrs.items():
+                layer_out.attrs[key] = value
+
+            weight_names = []
+            for weight_name in layer_in.attrs['weight_names']:
+                weight_name = decode_attr(weight_name)
+                weight = layer_in[weight_name][()]
+
+                if layer_classes.get(layer_name) == 'Embedding' and embedding == 'int8':
+                    # the scales are stored as an extra weight of the layer
+                    weight, scales = quantize_rows(weight)
+                    scale_name = weight_name.replace(":0", "") + "_scale:0"
+                    layer_out.create_dataset(scale_name, data=scales)
+                    layer_out.create_dataset(weight_name, data=weight)
+                    weight_names.extend([weight_name, scale_name])
+                    continue
+                elif layer_classes.get(layer_name) == 'Embedding' and embedding == 'float16':
+                    weight = weight.astype(np.float16)
+                elif layer_classes.get(layer_name) != 'Embedding' and float16_weights:
+                    weight = weight.astype(np.float16)
+
+                layer_out.create_dataset(weight_name, data=weight)
+                weight_names.append(weight_name)
+
+            layer_out.attrs['weight_names'] = [weight_name.encode('utf-8') for weight_name in weight_names]
+
+#########################################################
+#   get_weights_size
+#   bytes of the weights held in memory by a NumpyModel
+#########################################################
+def get_weights_size(model):
+    return sum(weight.nbytes for class_name, config, weights in model.layers for weight in weights)
+
+#########################################################
+#   compare_models
+#   evaluate the original and the quantized model on the test file
+#########################################################
+def compare_models(model_files, resources_file, test_file, batch_size = 500):
+    reader = DataReader(input_resources_pickle_file = resources_file)
+    test_X, test_Y, data_set, num_tokens_list = reader.read_and_parse_test_data(test_file)
+
+    results = {}
+    for model_file in model_files:
+        entityExtractor = EntityExtractor(reader)
+        start = t.default_timer()
+        entityExtractor.load(model_file, engine = 'numpy')
+        load_time = t.default_timer() - start
+
+        start = t.default_timer()
+        predicted_tags = entityExtractor.predict_tags(test_X, num_tokens_list, batch_size = batch_size)
+        tag_time = t.default_timer() - start
+
+        evaluation_report, conf_matrix_df = entityExtractor.evaluate_model(test_file, os.devnull, batch_size = batch_size)
+        print(evaluation_report)
+        results[model_file] = (predicted_tags, entityExtractor.get_entity_scores(conf_matrix_df), \
+                               get_weights_size(entityExtractor.model), load_time, tag_time)
+
+    (reference_tags, reference_scores, reference_size, _, reference_time) = results[model_files[0]]
+    print("model\tweights (MB)\tload (s)\ttagging (s)\tsentences/s\tprecision\trecall\tF1\tsame tags (%)")
+    for model_file in model_files:
+        predicted_tags, (precision, recall, f1), weights_size, load_time, tag_time = results[model_file]
+        same_tags = np.mean([p == r for p, r in zip(predicted_tags, reference_tags)]) * 100
+        print("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}".format(os.path.basename(model_file), round(weights_size / 2.0 ** 20, 3), \
+              round(load_time, 3), round(tag_time, 3), round(len(test_X) / tag_time, 1), \
+              round(precision, 4), round(recall, 4), round(f1, 4), round(same_tags, 2)))
+
+    (_, (_, _, quantized_f1), quantized_size, _, quantized_time) = results[model_files[1]]
+    print("F1 delta = {}, weights memory: x{} smaller, tagging time: x{}".format(round(quantized_f1 - reference_scores[2], 4), \
+          round(reference_size / float(quantized_size), 2), round(quantized_time / reference_time, 2)))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Quantize the entity extraction model for the numpy inference engine")
+    parser.add_argument("input_model", help = "keras .h5 model file")
+    parser.add_argument("output_model", help = "quantized .h5 model file")
+    parser.add_argument("--embedding", default = "int8", choices = ["int8", "float16", "float32"], \
+                        help = "type of the embedding lookup table")
+    parser.add_argument("--float16_weights", action = "store_true", help = "store the LSTM and Dense weights as float16")
+    parser.add_argument("--resources", help = "resources .pkl file, to compare the accuracy of both models")
+    parser.add_argument("--test_file", help = "labeled test file, to compare the accuracy of both models")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.input_model) == os.path.abspath(args.output_model):
+        print("The output file must be different from the input file")
+        sys.exit(1)
+
+    quantize_model(args.input_model, args.output_model, args.embedding, args.float16_weights)
+    print("File size: {} MB -> {} MB".format(round(os.path.getsize(args.input_model) / 2.0 ** 20, 2), \
+          round(os.path.getsize(args.output_model) / 2.0 ** 20, 2)))
+
+    if args.resources and args.test_file:
+        compare_models([args.input_model, args.output_model], args.resources, args.test_file)
+
+    print("Done.")
+
+if __name__ == "__main__":
+    main()